@@ -0,0 +1,89 @@
+"""pyserial 的本地替身，用于基准测试.
+
+模拟红外学习模块的应答：按下行帧的功能码回复对应的上行帧，不访问任何硬件。
+设置环境变量 FAKE_SERIAL_REALTIME=1 时按波特率模拟串口传输耗时。
+"""
+
+import os
+import time
+
+# 外部学习时上报的示例编码（取自模块说明书 AFN=20H 测试用例）
+SAMPLE_CODE = bytes.fromhex(
+    "84 01 21 83 01 21 2d 77 83 01 21 83 01 21 2d 77 2d 77 2d 77 2a 7a 2d 77"
+    " 81 01 23 2d ad 06 83 01 21 81 01 23 2b 79 81 01 23 81 01 23 2b 79 2b 79"
+    " 2b 7a 2b 79 2b 7a 81 01 23 2b af 06 81 01 23 81 01 23 2b 79 81 01 23 81"
+    " 01 23 2b 7a 2b 79 2b 7a 28 7c 29 7c 7f 25 2b af 06 80 01 24 82 01 23 2b"
+    " 79 82 01 22 84 01 20 2e 76 2e 77 2e 77 2b 79 2b 79 84 01 20 2b")
+
+
+class SerialException(IOError):
+    pass
+
+
+def _frame(afn, data=b''):
+    address = 0x00
+    length = 7 + len(data)
+    checksum = (address + afn + sum(data)) % 256
+    return bytes([0x68, length & 0xFF, length >> 8, address, afn]) + bytes(data) + bytes([checksum, 0x16])
+
+
+def _reply(afn, data):
+    if afn == 0x04:
+        return _frame(0x04, [4])
+    if afn == 0x06:
+        return _frame(0x06, [0])
+    if afn == 0x14:
+        return _frame(0x14, [data[0] if data else 0, 1])
+    if afn == 0x16:
+        return _frame(0x16, [10, 0])
+    if afn == 0x18:
+        return _frame(0x18, bytes([data[0] if data else 0, 0]) + SAMPLE_CODE)
+    if afn == 0x20:
+        return _frame(0x01, [0]) + _frame(0x22, SAMPLE_CODE)
+    return _frame(0x01, [0])
+
+
+class Serial:
+    def __init__(self, port=None, baudrate=115200, timeout=None, **kwargs):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self._rx = bytearray()
+        self._realtime = os.environ.get("FAKE_SERIAL_REALTIME") == "1"
+
+    def _wire_delay(self, nbytes):
+        if self._realtime and nbytes:
+            time.sleep(nbytes * 10 / self.baudrate)
+
+    def write(self, data):
+        data = bytes(data)
+        self._wire_delay(len(data))
+        if len(data) >= 7 and data[0] == 0x68:
+            self._rx.extend(_reply(data[4], data[5:-2]))
+        return len(data)
+
+    def read(self, size=1):
+        out = bytes(self._rx[:size])
+        del self._rx[:size]
+        self._wire_delay(len(out))
+        return out
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
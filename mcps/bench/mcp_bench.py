@@ -0,0 +1,374 @@
+"""MCP 工具调用基准测试.
+
+测量 ir_control 和 temperature_tool 两个工具的：
+- 冷启动：解释器启动、按模块拆分的导入耗时、一次完整的命令行调用
+- 热调用：进程内单次调用的延迟分布
+- 并发：N 个客户端同时调用时的吞吐量
+
+串口使用 fake_serial 目录下的 pyserial 替身，温湿度数据使用临时生成的
+数据文件和共享内存段，不需要任何硬件。结果输出为 JSON，可以用 --baseline
+指定上一次的结果文件做对比。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import mmap
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MCPS_DIR = os.path.dirname(BENCH_DIR)
+FAKE_SERIAL_DIR = os.path.join(BENCH_DIR, 'fake_serial')
+IR_DIR = os.path.join(MCPS_DIR, 'ir_control')
+TEMPERATURE_DIR = os.path.join(MCPS_DIR, 'temperature')
+
+# 替身必须排在最前，确保即使装了真实的 pyserial 也不会去开硬件串口
+for path in (TEMPERATURE_DIR, IR_DIR, FAKE_SERIAL_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+TOOLS = ('ir_control', 'temperature_tool')
+SENSOR_NAMES = ['客厅', '卧室', '书房', '厨房', '阳台', '儿童房', '次卧', '餐厅']
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples_ns, unit='us'):
+    """把纳秒样本汇总为延迟分布."""
+    scale = {'us': 1e3, 'ms': 1e6}[unit]
+    values = sorted(v / scale for v in samples_ns)
+    return {
+        'count': len(values),
+        f'min_{unit}': round(values[0], 3),
+        f'p50_{unit}': round(percentile(values, 50), 3),
+        f'p90_{unit}': round(percentile(values, 90), 3),
+        f'p99_{unit}': round(percentile(values, 99), 3),
+        f'max_{unit}': round(values[-1], 3),
+        f'mean_{unit}': round(statistics.fmean(values), 3),
+    }
+
+
+def subprocess_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([FAKE_SERIAL_DIR, IR_DIR, TEMPERATURE_DIR])
+    return env
+
+
+def time_process(cmd, runs, cwd=None):
+    env = subprocess_env()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter_ns()
+        subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def import_breakdown(module, top=15):
+    """用 -X importtime 拆分导入耗时，返回模块总耗时和最慢的若干个模块."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          env=subprocess_env(), capture_output=True, text=True, check=True)
+    modules = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        entry = {'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)}
+        if entry['module'] == module:
+            total_us = entry['cumulative_us']
+        if depth <= 1:
+            modules.append(entry)
+    modules.sort(key=lambda m: m['cumulative_us'], reverse=True)
+    return total_us, modules[:top]
+
+
+def bench_cold_start(runs, sample_hex):
+    result = {'interpreter': summarize(time_process([sys.executable, '-c', 'pass'], runs), 'ms')}
+    for module in TOOLS:
+        total_us, modules = import_breakdown(module)
+        result[module] = {
+            'import': summarize(time_process([sys.executable, '-c', f'import {module}'], runs), 'ms'),
+            'import_total_us': total_us,
+            'slowest_imports': modules,
+        }
+    cli = [sys.executable, os.path.join(IR_DIR, 'ir_control.py'),
+           '--port', 'fake', '--send-external-hex', sample_hex]
+    result['ir_control']['cli_send_external'] = summarize(time_process(cli, runs), 'ms')
+    return result
+
+
+def write_synthetic_data(tmpdir, sensor_count):
+    """生成与监控服务格式一致的数据文件和共享内存段."""
+    import temperature_tool
+
+    now = int(time.time())
+    sensors = []
+    for i in range(sensor_count):
+        sensors.append({
+            'name': SENSOR_NAMES[i % len(SENSOR_NAMES)] + ('' if i < len(SENSOR_NAMES) else str(i)),
+            'type': 'DHT22' if i % 2 else 'DHT11',
+            'status': 'ok',
+            'timestamp': now,
+            'humidity': 40 + i,
+            'temperature': 20 + i,
+        })
+
+    data_file = os.path.join(tmpdir, 'temperature_humidity.json')
+    with open(data_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': now,
+            'humidity': sensors[0]['humidity'],
+            'temperature': sensors[0]['temperature'],
+            'unit': {'humidity': '%', 'temperature': '°C'},
+            'sensors': sensors,
+        }, f, ensure_ascii=False)
+
+    shm_file = os.path.join(tmpdir, 'temperature_humidity.shm')
+    with open(shm_file, 'w+b') as f:
+        f.truncate(temperature_tool.SHM_SIZE)
+        with mmap.mmap(f.fileno(), temperature_tool.SHM_SIZE) as m:
+            temperature_tool.SHM_HEADER.pack_into(
+                m, 0, temperature_tool.SHM_MAGIC, temperature_tool.SHM_VERSION, 2, sensor_count, now)
+            for i, s in enumerate(sensors[:temperature_tool.SHM_MAX_SENSORS]):
+                temperature_tool.SHM_SLOT.pack_into(
+                    m, temperature_tool.SHM_HEADER.size + i * temperature_tool.SHM_SLOT.size,
+                    s['name'].encode('utf-8'), now, s['humidity'] * 10, s['temperature'] * 10,
+                    22 if s['type'] == 'DHT22' else 11, 1, 0, 0)
+    return data_file, shm_file
+
+
+def ir_args(ir_control, argv):
+    saved = sys.argv
+    sys.argv = ['ir_control.py'] + argv
+    try:
+        return ir_control.parse_args()
+    finally:
+        sys.argv = saved
+
+
+def ir_cases(ir_control, sample_hex):
+    return {
+        'send_external_hex': ir_args(ir_control, ['--send-external-hex', sample_hex]),
+        'get_baud': ir_args(ir_control, ['--get-baud']),
+    }
+
+
+def use_temperature_source(temperature_tool, source, data_file, shm_file):
+    temperature_tool.DATA_FILE = data_file
+    temperature_tool._shared_reader.close()
+    path = shm_file if source == 'shm' else os.path.join(os.path.dirname(data_file), 'missing.shm')
+    temperature_tool._shared_reader = temperature_tool.SharedReadingReader(path)
+
+
+def bench_warm(calls, sample_hex, data_file, shm_file):
+    import ir_control
+    import serial
+    import temperature_tool
+
+    result = {'ir_control': {}, 'temperature_tool': {}}
+
+    ser = serial.Serial('fake', 115200, timeout=2)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, args in ir_cases(ir_control, sample_hex).items():
+            samples = []
+            for _ in range(calls):
+                start = time.perf_counter_ns()
+                ir_control.execute_command(ser, args)
+                samples.append(time.perf_counter_ns() - start)
+            result['ir_control'][name] = summarize(samples)
+
+    async def run(n):
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter_ns()
+            await temperature_tool.get_temperature_humidity({})
+            samples.append(time.perf_counter_ns() - start)
+        return samples
+
+    for source in ('shm', 'file'):
+        use_temperature_source(temperature_tool, source, data_file, shm_file)
+        result['temperature_tool'][f'get_all_{source}'] = summarize(asyncio.run(run(calls)))
+    return result
+
+
+def bench_concurrent(clients, calls_per_client, process_rounds, sample_hex, data_file, shm_file):
+    import ir_control
+    import serial
+    import temperature_tool
+
+    result = {'clients': clients, 'ir_control': {}, 'temperature_tool': {}}
+    total = clients * calls_per_client
+
+    # ir_control：每个客户端一个线程、一个串口
+    args = ir_cases(ir_control, sample_hex)['send_external_hex']
+
+    def ir_client(_):
+        ser = serial.Serial('fake', 115200, timeout=2)
+        samples = []
+        for _ in range(calls_per_client):
+            start = time.perf_counter_ns()
+            ir_control.execute_command(ser, args)
+            samples.append(time.perf_counter_ns() - start)
+        return samples
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter_ns()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            samples = [s for chunk in pool.map(ir_client, range(clients)) for s in chunk]
+        elapsed = time.perf_counter_ns() - start
+    result['ir_control']['threads'] = {
+        'calls': total,
+        'throughput_per_s': round(total / (elapsed / 1e9), 1),
+        'latency': summarize(samples),
+    }
+
+    # ir_control：MCP 实际的调用方式，每次调用启动一个进程
+    if process_rounds > 0:
+        cli = [sys.executable, os.path.join(IR_DIR, 'ir_control.py'),
+               '--port', 'fake', '--send-external-hex', sample_hex]
+        env = subprocess_env()
+        start = time.perf_counter_ns()
+        for _ in range(process_rounds):
+            procs = [subprocess.Popen(cli, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                     for _ in range(clients)]
+            for p in procs:
+                p.wait()
+        elapsed = time.perf_counter_ns() - start
+        calls = process_rounds * clients
+        result['ir_control']['processes'] = {
+            'calls': calls,
+            'throughput_per_s': round(calls / (elapsed / 1e9), 1),
+        }
+
+    # temperature_tool：同一事件循环里的并发协程
+    async def temp_client():
+        samples = []
+        for _ in range(calls_per_client):
+            start = time.perf_counter_ns()
+            await temperature_tool.get_temperature_humidity({})
+            samples.append(time.perf_counter_ns() - start)
+            await asyncio.sleep(0)
+        return samples
+
+    async def temp_all():
+        start = time.perf_counter_ns()
+        chunks = await asyncio.gather(*(temp_client() for _ in range(clients)))
+        return time.perf_counter_ns() - start, [s for chunk in chunks for s in chunk]
+
+    for source in ('shm', 'file'):
+        use_temperature_source(temperature_tool, source, data_file, shm_file)
+        elapsed, samples = asyncio.run(temp_all())
+        result['temperature_tool'][f'get_all_{source}'] = {
+            'calls': total,
+            'throughput_per_s': round(total / (elapsed / 1e9), 1),
+            'latency': summarize(samples),
+        }
+    return result
+
+
+def flatten(tree, prefix=''):
+    """把结果展开为 路径 -> 数值，列表（如最慢导入模块）不参与对比."""
+    flat = {}
+    for key, value in tree.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(current, baseline):
+    sections = ('cold_start', 'warm', 'concurrent')
+    cur = flatten({k: current[k] for k in sections if k in current})
+    base = flatten({k: baseline[k] for k in sections if k in baseline})
+    comparison = {}
+    for path, value in cur.items():
+        if path not in base or path.rsplit('.', 1)[-1] in ('count', 'calls', 'clients'):
+            continue
+        before = base[path]
+        comparison[path] = {
+            'baseline': before,
+            'current': value,
+            'change_pct': round((value - before) / before * 100, 2) if before else None,
+        }
+    return comparison
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='MCP 工具调用延迟与冷启动基准测试')
+    parser.add_argument('--runs', type=int, default=10, help='冷启动测量次数 (默认: 10)')
+    parser.add_argument('--calls', type=int, default=2000, help='热调用次数 (默认: 2000)')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数 (默认: 8)')
+    parser.add_argument('--client-calls', type=int, default=200, help='每个客户端的调用次数 (默认: 200)')
+    parser.add_argument('--process-rounds', type=int, default=2,
+                        help='并发进程调用的轮数，0 表示跳过 (默认: 2)')
+    parser.add_argument('--sensors', type=int, default=3, help='合成数据中的传感器数量 (默认: 3)')
+    parser.add_argument('--skip-cold', action='store_true', help='跳过冷启动测量')
+    parser.add_argument('--realtime-uart', action='store_true', help='串口替身按波特率模拟传输耗时')
+    parser.add_argument('--baseline', metavar='FILE', help='与之对比的上一次结果 JSON')
+    parser.add_argument('--output', metavar='FILE', help='结果写入文件 (默认输出到标准输出)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.realtime_uart:
+        os.environ['FAKE_SERIAL_REALTIME'] = '1'
+
+    import serial
+    sample_hex = serial.SAMPLE_CODE.hex(' ')
+
+    result = {
+        'meta': {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'args': vars(args),
+        }
+    }
+
+    with tempfile.TemporaryDirectory(prefix='mcp_bench_') as tmpdir:
+        data_file, shm_file = write_synthetic_data(tmpdir, args.sensors)
+        if not args.skip_cold:
+            result['cold_start'] = bench_cold_start(args.runs, sample_hex)
+        result['warm'] = bench_warm(args.calls, sample_hex, data_file, shm_file)
+        result['concurrent'] = bench_concurrent(args.clients, args.client_calls, args.process_rounds,
+                                                sample_hex, data_file, shm_file)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            result['comparison'] = compare(result, json.load(f))
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
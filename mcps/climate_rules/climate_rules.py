@@ -0,0 +1,343 @@
+"""温湿度联动红外的规则引擎.
+
+常驻进程内订阅监控服务发布的读数，每来一个新样本就增量求值规则，满足条件时
+通过已经打开的串口发送红外编码，例如“客厅 10 分钟内温度一直高于 28°C 就开空调”。
+
+- 滑动窗口聚合（平均/最小/最大/最新）每个样本均摊 O(1)：平均值维护累加和，
+  最小/最大值维护单调队列
+- 触发条件带回差（release）和冷却时间（cooldown），读数在阈值附近抖动不会反复发送
+- 动作的指令帧在加载规则时预先生成，触发时只需写串口
+- 统计每条规则的求值耗时和触发延迟（读数发布到红外指令发完）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+RULES_DIR = os.path.dirname(os.path.abspath(__file__))
+MCPS_DIR = os.path.dirname(RULES_DIR)
+for path in (os.path.join(MCPS_DIR, 'temperature'), os.path.join(MCPS_DIR, 'ir_control')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import temperature_tool  # noqa: E402
+from ir_control import BAUD_RATE, SERIAL_PORT, build_action_frame  # noqa: E402
+
+METRICS = ('temperature', 'humidity')
+AGGREGATES = ('avg', 'min', 'max', 'last')
+REPORT_INTERVAL = 300
+LATENCY_HISTORY = 100
+# 两个样本的间隔超过上一个采样间隔的这个倍数（传感器连续失败、服务重启）就认为读数中断，
+# 窗口从中断后的第一个样本重新开始覆盖；偶尔跳过一轮采样不算中断
+MAX_GAP_FACTOR = 2.5
+
+
+class SlidingWindow:
+    """按时间的滑动窗口，push 和各聚合查询均摊 O(1)."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()   # (序号, 时间, 值)
+        self.mins = deque()      # 值单调递增，队首为最小值
+        self.maxs = deque()      # 值单调递减，队首为最大值
+        self.total = 0.0
+        self.count = 0           # 已加入过的样本总数，用作序号
+        self.first_time = None   # 本段连续读数的第一个样本时间
+        self.last_time = None
+        self.interval = None     # 上一个采样间隔
+        self.gaps = 0            # 读数中断的次数
+
+    def push(self, t, value):
+        if self.first_time is None:
+            self.first_time = t
+        elif self.last_time is not None:
+            gap = t - self.last_time
+            if gap > self.seconds or (self.interval and gap > self.interval * MAX_GAP_FACTOR):
+                self.first_time = t
+                self.gaps += 1
+            else:
+                self.interval = gap
+        self.last_time = t
+        sample = (self.count, t, value)
+        self.count += 1
+        self.samples.append(sample)
+        self.total += value
+        while self.mins and self.mins[-1][2] >= value:
+            self.mins.pop()
+        self.mins.append(sample)
+        while self.maxs and self.maxs[-1][2] <= value:
+            self.maxs.pop()
+        self.maxs.append(sample)
+
+        cutoff = t - self.seconds
+        while self.samples and self.samples[0][1] < cutoff:
+            old = self.samples.popleft()
+            self.total -= old[2]
+            if self.mins[0][0] == old[0]:
+                self.mins.popleft()
+            if self.maxs[0][0] == old[0]:
+                self.maxs.popleft()
+
+    def full(self, now):
+        """自读数中断后的样本已覆盖整个窗口时长，"持续 N 分钟"类的条件才有意义"""
+        return self.first_time is not None and now - self.first_time >= self.seconds
+
+    def value(self, aggregate):
+        if not self.samples:
+            return None
+        if aggregate == 'avg':
+            return self.total / len(self.samples)
+        if aggregate == 'min':
+            return self.mins[0][2]
+        if aggregate == 'max':
+            return self.maxs[0][2]
+        return self.samples[-1][2]
+
+
+class Action:
+    """预先生成好指令帧的红外动作."""
+
+    def __init__(self, spec, ac_profile):
+        if not isinstance(spec, dict) or len(spec) != 1:
+            raise ValueError(f"动作必须是只有一个键的对象: {spec}")
+        kind, value = next(iter(spec.items()))
+        self.frame = build_action_frame(kind, value, ac_profile['path'], ac_profile.setdefault('models', {}))
+        self.description = f"{kind}={value}"
+
+
+class Rule:
+    """一条阈值规则及其运行状态和统计."""
+
+    def __init__(self, spec, ac_profile):
+        self.name = spec['name']
+        self.sensor = spec.get('sensor')
+        if self.sensor is None or self.sensor == '':
+            raise ValueError(f"规则 {self.name}: 缺少 sensor")
+        self.metric = spec.get('metric', 'temperature')
+        self.aggregate = spec.get('aggregate', 'avg')
+        self.window = float(spec.get('window', 0))
+        self.cooldown = float(spec.get('cooldown', 0))
+        if self.metric not in METRICS:
+            raise ValueError(f"规则 {self.name}: metric 必须是 {' / '.join(METRICS)}")
+        if self.aggregate not in AGGREGATES:
+            raise ValueError(f"规则 {self.name}: aggregate 必须是 {' / '.join(AGGREGATES)}")
+        if ('above' in spec) == ('below' in spec):
+            raise ValueError(f"规则 {self.name}: above 和 below 必须且只能设置一个")
+        self.above = 'above' in spec
+        self.threshold = float(spec['above'] if self.above else spec['below'])
+        # 回差：高于阈值触发后，要回落到 release 以下才算解除，默认与阈值相同
+        self.release = float(spec.get('release', self.threshold))
+        if (self.above and self.release > self.threshold) or (not self.above and self.release < self.threshold):
+            raise ValueError(f"规则 {self.name}: release 应在阈值的解除一侧")
+        self.action = Action(spec['action'], ac_profile)
+        self.release_action = Action(spec['release_action'], ac_profile) if spec.get('release_action') else None
+
+        self.active = False
+        self.last_fired = None
+        self.evaluations = 0
+        self.eval_ns = 0
+        self.eval_max_ns = 0
+        self.fired = 0
+        self.suppressed = 0
+        self.latencies_ns = deque(maxlen=LATENCY_HISTORY)
+        self.last_value = None
+
+    def evaluate(self, window, now):
+        """根据窗口聚合值更新状态，返回需要执行的动作或 None；now 为样本时间戳"""
+        if self.window and not window.full(now):
+            return None
+        value = window.value(self.aggregate)
+        if value is None:
+            return None
+        self.last_value = value
+
+        if self.active:
+            released = value < self.release if self.above else value > self.release
+            if released:
+                self.active = False
+                return self.release_action
+            return None
+
+        hit = value > self.threshold if self.above else value < self.threshold
+        if not hit:
+            return None
+        if self.last_fired is not None and now - self.last_fired < self.cooldown:
+            # 冷却中不改变状态，冷却结束后条件仍满足会再触发
+            self.suppressed += 1
+            return None
+        self.active = True
+        self.last_fired = now
+        self.fired += 1
+        return self.action
+
+    def stats(self):
+        latencies = sorted(self.latencies_ns)
+        return {
+            'active': self.active,
+            'value': round(self.last_value, 2) if self.last_value is not None else None,
+            'evaluations': self.evaluations,
+            'eval_avg_us': round(self.eval_ns / self.evaluations / 1000, 2) if self.evaluations else None,
+            'eval_max_us': round(self.eval_max_ns / 1000, 2),
+            'fired': self.fired,
+            'suppressed_by_cooldown': self.suppressed,
+            'trigger_latency_ms': {
+                'p50': round(latencies[len(latencies) // 2] / 1e6, 3),
+                'max': round(latencies[-1] / 1e6, 3),
+                'samples': len(latencies),
+            } if latencies else None,
+        }
+
+
+class RulesEngine:
+    """把新读数推入滑动窗口，只对相关传感器的规则求值."""
+
+    def __init__(self, rules, ser=None):
+        self.rules = rules
+        self.ser = ser
+        self.windows = {}
+        self.by_sensor = {}
+        self.last_timestamp = {}
+        for rule in rules:
+            key = (rule.sensor, rule.metric, rule.window)
+            self.windows.setdefault(key, SlidingWindow(rule.window))
+            self.by_sensor.setdefault(rule.sensor, []).append(rule)
+
+    def on_readings(self, sensors, received_ns):
+        """处理一次发布的全部读数，received_ns 为收到这次发布的时刻 (perf_counter_ns)"""
+        for index, reading in enumerate(sensors):
+            name = reading.get('name')
+            timestamp = reading.get('timestamp')
+            if reading.get('status') != 'ok' or timestamp is None:
+                continue
+            # 其他传感器的发布也会带上本传感器未变的读数，按时间戳去重
+            if self.last_timestamp.get(name) == timestamp:
+                continue
+            self.last_timestamp[name] = timestamp
+
+            # 规则的 sensor 可以写名称或序号
+            rules = self.by_sensor.get(name, []) + self.by_sensor.get(index, [])
+            pushed = set()
+            for rule in rules:
+                start = time.perf_counter_ns()
+                key = (rule.sensor, rule.metric, rule.window)
+                window = self.windows[key]
+                if key not in pushed:
+                    window.push(timestamp, reading[rule.metric])
+                    pushed.add(key)
+                action = rule.evaluate(window, timestamp)
+                elapsed = time.perf_counter_ns() - start
+                rule.evaluations += 1
+                rule.eval_ns += elapsed
+                rule.eval_max_ns = max(rule.eval_max_ns, elapsed)
+                if action is not None:
+                    self.dispatch(rule, action, reading, received_ns)
+
+    def dispatch(self, rule, action, reading, received_ns):
+        state = '触发' if action is rule.action else '解除'
+        print(f"[{time.strftime('%H:%M:%S')}] 规则 {rule.name} {state}: {reading.get('name')} "
+              f"{rule.metric} {rule.aggregate}={rule.last_value:.1f}，发送 {action.description}", flush=True)
+        if self.ser is not None:
+            try:
+                self.ser.write(action.frame)
+                if not self.ser.read(8):
+                    print(f"  规则 {rule.name}: 未收到模块回复", flush=True)
+            except Exception as e:
+                print(f"  规则 {rule.name}: 发送失败: {e}", flush=True)
+                return
+        rule.latencies_ns.append(time.perf_counter_ns() - received_ns)
+
+    def report(self):
+        return {rule.name: rule.stats() for rule in self.rules}
+
+
+def load_rules(path, ac_profile_path):
+    with open(path, 'r', encoding='utf-8') as f:
+        specs = json.load(f).get('rules', [])
+    if not specs:
+        raise ValueError(f"{path} 中没有规则")
+    ac_profile = {'path': ac_profile_path}
+    for i, spec in enumerate(specs):
+        spec.setdefault('name', f"rule{i + 1}")
+    rules = [Rule(spec, ac_profile) for spec in specs]
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError("规则名称重复")
+    return rules
+
+
+async def run(engine, poll_interval, report_interval):
+    last_report = time.monotonic()
+    async for _, sensors in temperature_tool.watch_readings(poll_interval=poll_interval):
+        engine.on_readings(sensors, time.perf_counter_ns())
+        if report_interval and time.monotonic() - last_report >= report_interval:
+            last_report = time.monotonic()
+            print(json.dumps(engine.report(), ensure_ascii=False), flush=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='温湿度联动红外规则引擎')
+    parser.add_argument('--rules', default=os.path.join(RULES_DIR, 'rules.json'), metavar='FILE',
+                        help='规则文件 (默认: 本目录下的 rules.json)')
+    parser.add_argument('--port', default=SERIAL_PORT, help=f'串口设备 (默认: {SERIAL_PORT})')
+    parser.add_argument('--baud', type=int, default=BAUD_RATE, help=f'波特率 (默认: {BAUD_RATE})')
+    parser.add_argument('--ac-profile', default='ac_profile.json', metavar='FILE',
+                        help='ac 动作使用的空调学习样本文件 (默认: ac_profile.json)')
+    parser.add_argument('--data-file', default=temperature_tool.DATA_FILE, help='温湿度数据文件')
+    parser.add_argument('--shm', default=temperature_tool.SHM_PATH, help='温湿度共享内存段')
+    parser.add_argument('--poll-interval', type=float, default=temperature_tool.WATCH_POLL_INTERVAL,
+                        help='无法使用 inotify 时检查新读数的间隔 (秒)')
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL,
+                        help=f'输出规则统计的间隔 (秒, 默认 {REPORT_INTERVAL}, 0 为只在退出时输出)')
+    parser.add_argument('--dry-run', action='store_true', help='不打开串口，只打印将要发送的动作')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        rules = load_rules(args.rules, args.ac_profile)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"错误: 加载规则失败: {e}")
+        return 1
+
+    temperature_tool.DATA_FILE = args.data_file
+    if args.shm != temperature_tool.SHM_PATH:
+        temperature_tool._shared_reader.close()
+        temperature_tool._shared_reader = temperature_tool.SharedReadingReader(args.shm)
+
+    ser = None
+    if not args.dry_run:
+        import serial
+        try:
+            ser = serial.Serial(args.port, args.baud, timeout=2)
+            print(f"成功打开串口 {args.port}")
+        except serial.SerialException as e:
+            print(f"错误: 无法打开串口 {args.port}. {e}")
+            return 1
+
+    engine = RulesEngine(rules, ser)
+    print(f"已加载 {len(rules)} 条规则，等待温湿度读数...", flush=True)
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(run(engine, args.poll_interval, args.report_interval))
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        loop.close()
+        if ser is not None:
+            ser.close()
+        print(json.dumps(engine.report(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""空调红外编码生成器
+
+空调遥控器每次按键都发送完整状态（模式、温度、风速、扫风等），逐个组合学习需要几百条编码。
+这里从少量学习样本推断出帧里每一位的含义，再按需为任意状态生成编码：
+
+1. 用 ir_codec 把样本解析成位序列，所有样本的帧结构必须一致
+2. 所有样本中都不变的位视为常量
+3. 每帧最后一个字节若满足 求和/异或/半字节求和（可取反、带偏移）关系，视为校验字节
+4. 与前面某个字节或某一位始终相同或始终相反的视为派生位（重复帧、反码字节）
+5. 剩余可变位按“只有一个参数不同”的样本对归属到各参数
+6. 数值参数（温度）符合线性关系时可生成没学过的数值，其它参数记录每个取值对应的位组合
+
+样本保存在 JSON 配置文件中，每条为 {"state": {...}, "code": "十六进制编码"}。
+"""
+
+import json
+import os
+from collections import OrderedDict
+from functools import reduce
+
+import ir_codec
+
+DEFAULT_PROFILE = 'ac_profile.json'
+CACHE_SIZE = 32
+STATE_ORDER = ('mode', 'temp', 'fan', 'swing')
+
+CHECKSUM_FUNCS = {
+    'sum': lambda values: sum(values),
+    'xor': lambda values: reduce(lambda a, b: a ^ b, values, 0),
+    'nibble_sum': lambda values: sum((v & 0x0F) + (v >> 4) for v in values),
+}
+CHECKSUM_TARGETS = {'byte': (0, 8), 'low': (0, 4), 'high': (4, 4)}
+
+
+def parse_state(text):
+    """解析状态字符串，如 'mode=cool,temp=24,fan=auto'，也可按 模式 温度 风速 扫风 的顺序省略键名"""
+    state = {}
+    positional = list(STATE_ORDER)
+    for token in text.replace(',', ' ').split():
+        if '=' in token:
+            key, value = token.split('=', 1)
+            key = key.strip().lower()
+        else:
+            if not positional:
+                raise ValueError(f"无法识别的状态参数: {token}")
+            key, value = positional[0], token
+        if key in positional:
+            positional.remove(key)
+        value = value.strip()
+        state[key] = int(value) if value.lstrip('-').isdigit() else value.lower()
+    if not state:
+        raise ValueError("状态为空")
+    return state
+
+
+def state_key(state):
+    keys = [k for k in STATE_ORDER if k in state] + sorted(k for k in state if k not in STATE_ORDER)
+    return ','.join(f"{k}={state[k]}" for k in keys)
+
+
+def load_profile(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('samples', [])
+
+
+def save_profile(path, samples):
+    """先写临时文件再替换，避免中断时留下半个文件"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'samples': samples}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def add_sample(path, state, data):
+    """把学习到的编码作为该状态的样本保存，同一状态只保留最新一条"""
+    key = state_key(state)
+    samples = [s for s in load_profile(path) if state_key(s['state']) != key]
+    samples.append({'state': state, 'code': bytes(data).hex(' ')})
+    save_profile(path, samples)
+    return len(samples)
+
+
+class ACModel:
+    """由学习样本推断出的空调帧布局，encode() 为任意状态生成外部编码数据"""
+
+    def __init__(self, samples):
+        """samples: [(状态字典, 外部编码数据 bytes), ...]"""
+        if len(samples) < 2:
+            raise ValueError("至少需要两个样本")
+        self.states = [dict(state) for state, _ in samples]
+        self.codes = []
+        for state, data in samples:
+            try:
+                self.codes.append(ir_codec.parse_frames(ir_codec.decode_timings(data)))
+            except ValueError as e:
+                raise ValueError(f"样本 {state_key(state)} 无法解析: {e}")
+
+        first = self.codes[0]
+        self.frame_lengths = [len(f['bits']) for f in first['frames']]
+        for state, code in zip(self.states, self.codes):
+            if code['kind'] != first['kind'] or [len(f['bits']) for f in code['frames']] != self.frame_lengths:
+                raise ValueError(f"样本 {state_key(state)} 的帧结构与其它样本不一致")
+        self.frame_starts = [sum(self.frame_lengths[:i]) for i in range(len(self.frame_lengths))]
+        self.positions = [(fi, k) for fi, n in enumerate(self.frame_lengths) for k in range(n)]
+        self.bits = [[b for f in code['frames'] for b in f['bits']] for code in self.codes]
+        self.field_names = sorted({k for s in self.states for k in s},
+                                  key=lambda k: (STATE_ORDER.index(k) if k in STATE_ORDER else len(STATE_ORDER), k))
+
+        errors = []
+        for lsb_first in (True, False):
+            try:
+                self._infer(lsb_first)
+                self._verify()
+                break
+            except ValueError as e:
+                errors.append(str(e))
+        else:
+            raise ValueError(errors[0])
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_profile(cls, path=DEFAULT_PROFILE):
+        samples = load_profile(path)
+        return cls([(s['state'], bytes.fromhex(s['code'].replace(' ', ''))) for s in samples])
+
+    # ---- 位置换算 ----
+
+    def _byte_bit(self, frame, byte, k):
+        """帧内第 byte 个字节中权值为 2^k 的位的全局序号"""
+        offset = byte * 8 + (k if self.lsb_first else 7 - k)
+        return self.frame_starts[frame] + offset
+
+    def _frame_bytes(self, bits, frame):
+        start = self.frame_starts[frame]
+        return ir_codec.bits_to_bytes(bits[start:start + self.frame_lengths[frame]], self.lsb_first)
+
+    # ---- 推断 ----
+
+    def _infer(self, lsb_first):
+        self.lsb_first = lsb_first
+        n = len(self.bits[0])
+        varying = [i for i in range(n) if len({b[i] for b in self.bits}) > 1]
+
+        self.checksums = self._find_checksums(varying)
+        checksum_bits = {bit for cs in self.checksums for bit in cs['bits']}
+
+        # 整字节的副本或反码（重复帧、NEC 式反码字节）整体派生，数值字段补进来的常量位也能跟着变
+        self.derived = {}
+        byte_starts = [self.frame_starts[fi] + k for fi, length in enumerate(self.frame_lengths)
+                       for k in range(0, length - 7, 8)]
+        values = [[tuple(b[s:s + 8]) for s in byte_starts] for b in self.bits]
+        for j, start in enumerate(byte_starts):
+            if start in checksum_bits or len({v[j] for v in values}) < 2:
+                continue
+            for i in range(j):
+                if all(v[i] == v[j] for v in values):
+                    invert = 0
+                elif all(all(x != y for x, y in zip(v[i], v[j])) for v in values):
+                    invert = 1
+                else:
+                    continue
+                if byte_starts[i] not in self.derived:
+                    for k in range(8):
+                        self.derived[start + k] = (byte_starts[i] + k, invert)
+                    break
+
+        for j in varying:
+            if j in self.derived or j in checksum_bits:
+                continue
+            for i in varying:
+                if i >= j:
+                    break
+                if self.positions[i][1] % 8 != self.positions[j][1] % 8 or i in self.derived:
+                    continue
+                if all(b[i] == b[j] for b in self.bits):
+                    self.derived[j] = (i, 0)
+                    break
+                if all(b[i] != b[j] for b in self.bits):
+                    self.derived[j] = (i, 1)
+                    break
+
+        free = [i for i in varying if i not in checksum_bits and i not in self.derived]
+        owner = {}
+        for a in range(len(self.states)):
+            for b in range(a + 1, len(self.states)):
+                changed = [f for f in self.field_names if self.states[a].get(f) != self.states[b].get(f)]
+                diff = [i for i in free if self.bits[a][i] != self.bits[b][i]]
+                if not changed and diff:
+                    raise ValueError(f"状态相同的两个样本编码不同（第 {diff[0]} 位），样本中可能含有定时等额外信息")
+                if len(changed) != 1:
+                    continue
+                for i in diff:
+                    if owner.setdefault(i, changed[0]) != changed[0]:
+                        raise ValueError(f"第 {i} 位同时随 {owner[i]} 和 {changed[0]} 变化")
+        unclaimed = [i for i in free if i not in owner]
+        if unclaimed:
+            raise ValueError(f"无法确定第 {unclaimed[0]} 位属于哪个参数，请补充只改变一个参数的样本")
+
+        self.fields = {}
+        for name in self.field_names:
+            bits = sorted(i for i, f in owner.items() if f == name)
+            values = [s.get(name) for s in self.states]
+            numeric = None
+            if all(isinstance(v, int) for v in values):
+                numeric = self._numeric_field(bits, values, set(varying))
+            if numeric:
+                self.fields[name] = numeric
+            else:
+                # 非数值参数，或数值按查表编码（如美的的温度），只能生成学习过的取值
+                table = {}
+                for state, sample in zip(self.states, self.bits):
+                    if name not in state:
+                        continue
+                    pattern = tuple(sample[i] for i in bits)
+                    if table.setdefault(state[name], pattern) != pattern:
+                        raise ValueError(f"{name}={state[name]} 在不同样本中的编码不一致")
+                self.fields[name] = {'type': 'choice', 'bits': bits, 'table': table}
+
+    def _numeric_field(self, bits, values, varying):
+        seen = sorted(set(values))
+        if not bits:
+            return {'type': 'number', 'bits': [], 'seen': seen}
+
+        # 数值一般占满一个半字节，把同一半字节里的常量位补进来，生成没见过的数值时才有足够的位
+        extended = set(bits)
+        for i in bits:
+            frame, k = self.positions[i]
+            base = k - k % 4
+            for kk in range(base, min(base + 4, self.frame_lengths[frame])):
+                j = self.frame_starts[frame] + kk
+                if j not in varying:
+                    extended.add(j)
+        # 按权值从低到高排列：低位在前时即为发送顺序，高位在前时相反
+        ordered = sorted(extended, reverse=not self.lsb_first)
+
+        def encoded(sample):
+            return sum(sample[i] << rank for rank, i in enumerate(ordered))
+
+        for scale in (1, -1):
+            offset = encoded(self.bits[0]) - scale * values[0]
+            if all(encoded(b) == scale * v + offset for b, v in zip(self.bits, values)):
+                return {'type': 'number', 'bits': ordered, 'scale': scale, 'offset': offset, 'seen': seen}
+        return None
+
+    def _find_checksums(self, varying):
+        varying = set(varying)
+        found = []
+        for frame, length in enumerate(self.frame_lengths):
+            byte = length // 8 - 1
+            if byte < 1:
+                continue
+            frames = [self._frame_bytes(b, frame) for b in self.bits]
+            if len({tuple(f[:byte]) for f in frames}) < 2:
+                continue
+            for target, (shift, width) in CHECKSUM_TARGETS.items():
+                bits = [self._byte_bit(frame, byte, k) for k in range(shift, shift + width)]
+                if not varying.intersection(bits):
+                    continue
+                mask = (1 << width) - 1
+                targets = [(f[byte] >> shift) & mask for f in frames]
+                match = None
+                for func_name, func in CHECKSUM_FUNCS.items():
+                    for sign in (1, -1):
+                        consts = {(t - sign * func(f[:byte])) & mask for t, f in zip(targets, frames)}
+                        if len(consts) == 1:
+                            match = {'frame': frame, 'byte': byte, 'target': target, 'func': func_name,
+                                     'sign': sign, 'const': consts.pop(), 'bits': bits}
+                            break
+                    if match:
+                        break
+                if match:
+                    found.append(match)
+                    if target == 'byte':
+                        break
+        return found
+
+    def _verify(self):
+        """留一法复现样本：用其余样本作模板生成每个样本，必须与学习到的完全一致"""
+        for idx, (state, sample) in enumerate(zip(self.states, self.bits)):
+            others = [i for i in range(len(self.states)) if i != idx]
+            try:
+                bits, _ = self._synth_bits(state, others)
+            except ValueError:
+                continue  # 该样本含有其余样本中没有的取值，无法单独验证
+            if bits != sample:
+                wrong = next(i for i in range(len(bits)) if bits[i] != sample[i])
+                raise ValueError(f"推断结果无法复现样本 {state_key(state)}（第 {wrong} 位）")
+
+    # ---- 生成 ----
+
+    def _synth_bits(self, state, candidates):
+        template = max(candidates, key=lambda i: (sum(self.states[i].get(k) == v for k, v in state.items()), -i))
+        full = dict(self.states[template])
+        full.update(state)
+        bits = list(self.bits[template])
+
+        for name, field in self.fields.items():
+            value = full.get(name)
+            if field['type'] == 'number':
+                if not field['bits']:
+                    if value not in field['seen']:
+                        raise ValueError(f"样本中 {name} 只有 {field['seen']}，无法生成 {name}={value}")
+                    continue
+                if not isinstance(value, int):
+                    raise ValueError(f"{name} 必须是整数")
+                encoded = field['scale'] * value + field['offset']
+                if not 0 <= encoded < (1 << len(field['bits'])):
+                    raise ValueError(f"{name}={value} 超出可编码范围")
+                for rank, i in enumerate(field['bits']):
+                    bits[i] = (encoded >> rank) & 1
+            else:
+                if value not in field['table']:
+                    known = ', '.join(str(v) for v in field['table'])
+                    raise ValueError(f"{name}={value} 没有学习过，可选: {known}")
+                for i, bit in zip(field['bits'], field['table'][value]):
+                    bits[i] = bit
+
+        self._apply_derived(bits)
+        for cs in self.checksums:
+            shift, width = CHECKSUM_TARGETS[cs['target']]
+            frame_bytes = self._frame_bytes(bits, cs['frame'])
+            value = (cs['sign'] * CHECKSUM_FUNCS[cs['func']](frame_bytes[:cs['byte']]) + cs['const']) & ((1 << width) - 1)
+            for k, i in enumerate(cs['bits']):
+                bits[i] = (value >> k) & 1
+        self._apply_derived(bits)
+        return bits, template
+
+    def _apply_derived(self, bits):
+        for j in sorted(self.derived):
+            i, invert = self.derived[j]
+            bits[j] = bits[i] ^ invert
+
+    def encode(self, state):
+        """生成该状态的外部编码数据（发送时作为 AFN=22H 的数据域），最近用过的状态会被缓存"""
+        key = state_key(state)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        bits, template = self._synth_bits(state, range(len(self.states)))
+        code = dict(self.codes[template])
+        frames = []
+        for fi, frame in enumerate(code['frames']):
+            start = self.frame_starts[fi]
+            frames.append(dict(frame, bits=bits[start:start + self.frame_lengths[fi]]))
+        code['frames'] = frames
+        data = ir_codec.encode_timings(ir_codec.build_durations(code))
+
+        self._cache[key] = data
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return data
+
+    def layout(self):
+        """推断结果的可读描述"""
+        fields = {}
+        for name, field in self.fields.items():
+            info = {'type': field['type'], 'bits': field['bits']}
+            if field['type'] == 'number':
+                info['seen'] = field['seen']
+                if field['bits']:
+                    info['encoding'] = f"{field['scale']:+d} * {name} + {field['offset']}"
+            else:
+                info['values'] = {str(v): ''.join(map(str, p)) for v, p in field['table'].items()}
+            fields[name] = info
+        return {
+            'modulation': self.codes[0]['kind'],
+            'bit_order': 'lsb_first' if self.lsb_first else 'msb_first',
+            'frame_bits': self.frame_lengths,
+            'samples': len(self.states),
+            'fields': fields,
+            'checksums': [{k: v for k, v in cs.items() if k != 'bits'} for cs in self.checksums],
+            'derived_bits': len(self.derived),
+        }
@@ -0,0 +1,381 @@
+"""语音意图到红外指令帧的预编译索引
+
+语音识别出的文字（如“客厅电视音量加”）直接查表得到可以写串口的指令帧，
+中间不再经过命令行参数和编码文件解析。
+
+编码库为 JSON 文件（默认 ir_library.json）：
+
+    {
+      "rooms":   {"客厅": ["大厅"]},
+      "devices": {"电视": ["电视机", "TV"]},
+      "actions": {"音量加": ["声音大一点", "调大音量"]},
+      "commands": [
+        {"room": "客厅", "device": "电视", "action": "音量加", "file": "tv_vol_up.hex"},
+        {"room": "客厅", "device": "空调", "action": "制冷", "ac": "mode=cool,temp=26"},
+        {"device": "灯", "action": "开", "internal": 0}
+      ]
+    }
+
+每条命令只能有 internal / hex / file / ac 其中一种动作，file 的相对路径相对于编码库所在目录。
+加载时展开 房间 × 设备 × 动作 的全部别名组合和常见语序（房间可以省略），预先生成指令帧；
+安装了 pypinyin 时还会按拼音建索引，识别成同音字也能命中。
+查找顺序：精确匹配 → 拼音精确匹配 → 二元组模糊匹配；另有按前缀列出候选。
+常驻进程加载一次后查找只是查表；编码库修改后 reload_if_changed() 在调用方线程中同步重建，
+建好后一次性替换引用，重建期间其他线程的查找仍使用旧索引，不会看到半成品。
+lazy=True 时加载只建说法索引，指令帧在第一次 compile() 时才生成，供只查一条命令的命令行使用。
+"""
+
+import bisect
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+
+from ir_control import ACTION_KINDS, build_action_frame
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+DEFAULT_LIBRARY = 'ir_library.json'
+# 模糊匹配的最低相似度（二元组 Dice 系数）
+FUZZY_MIN_SCORE = 0.6
+# 拼音音节之间的分隔符（normalize 会去掉空白，不会和文字混淆）
+PINYIN_SEPARATOR = ' '
+# reload_if_changed() 检查文件修改时间的最短间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+# 口语里常见、对意图没有影响的字词
+FILLER_WORDS = ('帮我', '请', '把', '给我', '一下', '吧', '呀', '啊', '了')
+_PUNCTUATION = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    """全角转半角、小写、去掉标点空白和语气词"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = _PUNCTUATION.sub('', text)
+    for word in FILLER_WORDS:
+        text = text.replace(word, '')
+    return text
+
+
+def to_pinyin(text):
+    """拼音按音节用空格分隔，否则 jia(加) 会被当成 jian(减) 的一部分"""
+    return PINYIN_SEPARATOR.join(lazy_pinyin(text)) if lazy_pinyin and text else None
+
+
+def _mentions(query, keys, syllables):
+    """query 中是否出现 keys 之一；拼音只按整个音节比较"""
+    if syllables:
+        query = f"{PINYIN_SEPARATOR}{query}{PINYIN_SEPARATOR}"
+        return any(f"{PINYIN_SEPARATOR}{k}{PINYIN_SEPARATOR}" in query for k in keys)
+    return any(k in query for k in keys)
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} if len(text) > 1 else {text}
+
+
+class Intent:
+    """一条编译好的命令：指令帧或内部编码槽位"""
+
+    __slots__ = ('room', 'device', 'action', 'kind', 'value', 'frame', 'slot', 'device_keys', 'action_keys',
+                 '_source')
+
+    def __init__(self, room, device, action, kind, value, source):
+        self.room = room
+        self.device = device
+        self.action = action
+        self.kind = kind
+        self.value = value
+        self.frame = None
+        self.slot = int(value) if kind == 'internal' else None
+        self.device_keys = ()
+        self.action_keys = ()
+        self._source = source
+
+    def compile(self):
+        """生成并缓存指令帧，编码文件或空调配置有误时抛出 OSError / ValueError"""
+        if self.frame is None:
+            self.frame = build_action_frame(*self._source)
+        return self.frame
+
+    def name(self):
+        return f"{self.room or ''}{self.device}{self.action}"
+
+    def __repr__(self):
+        return f"Intent({self.name()}, {self.kind}={self.value})"
+
+
+class _Compiled:
+    """不可变的索引快照"""
+
+    def __init__(self, library, base_dir, lazy=False):
+        rooms = library.get('rooms', {})
+        devices = library.get('devices', {})
+        actions = library.get('actions', {})
+        ac_models = {}
+        self.intents = []
+        self.ambiguous = {}
+        # 完整说法冲突说明编码库有误；省略房间的说法冲突只是有歧义，去掉即可
+        strong = ({}, {})
+        weak = ({}, {})
+
+        for i, command in enumerate(library.get('commands', [])):
+            kinds = [k for k in ACTION_KINDS if k in command]
+            if len(kinds) != 1:
+                raise ValueError(f"第 {i + 1} 条命令必须且只能有 {' / '.join(ACTION_KINDS)} 其中一种动作")
+            kind = kinds[0]
+            value = command[kind]
+            if kind == 'file' and not os.path.isabs(value):
+                value = os.path.join(base_dir, value)
+            room, device, action = command.get('room'), command.get('device'), command.get('action')
+            if not device or not action:
+                raise ValueError(f"第 {i + 1} 条命令缺少 device 或 action")
+            ac_profile = os.path.join(base_dir, command.get('ac_profile', 'ac_profile.json'))
+            intent = Intent(room, device, action, kind, command[kind], (kind, value, ac_profile, ac_models))
+            if not lazy:
+                try:
+                    intent.compile()
+                except (OSError, ValueError) as e:
+                    raise ValueError(f"第 {i + 1} 条命令 {room or ''}{device}{action}: {e}")
+            self.intents.append(intent)
+
+            room_names = [room] + list(rooms.get(room, [])) if room else ['']
+            device_names = [device] + list(devices.get(device, []))
+            action_names = [action] + list(actions.get(action, []))
+            intent.device_keys = self._keys(device_names)
+            intent.action_keys = self._keys(action_names)
+            for r in room_names:
+                for d in device_names:
+                    for a in action_names:
+                        for phrase in (r + d + a, d + r + a, a + r + d, r + a + d):
+                            self._add(strong, phrase, intent, True)
+            # 省略房间：只有一个房间有这个设备动作时才能唯一确定
+            if room:
+                for d in device_names:
+                    for a in action_names:
+                        self._add(weak, d + a, intent, False)
+                        self._add(weak, a + d, intent, False)
+                        self.ambiguous.setdefault(normalize(d + a), []).append(intent)
+                        self.ambiguous.setdefault(normalize(a + d), []).append(intent)
+
+        self.exact, self.pinyin = ({k: v for k, v in w.items() if v is not None} for w in weak)
+        for table, full in zip((self.exact, self.pinyin), strong):
+            for k in full:
+                table.pop(k, None)
+            table.update((k, v) for k, v in full.items() if v is not None)
+        self.ambiguous = {k: sorted(set(v), key=self.intents.index) for k, v in self.ambiguous.items()
+                          if len(set(v)) > 1 and k not in self.exact}
+        self.keys = sorted(self.exact)
+        # 二元组倒排表，模糊匹配只需要看和查询有共同二元组的说法
+        self.grams = {}
+        self.gram_counts = {}
+        for table in (self.exact, self.pinyin):
+            for key in table:
+                grams = _bigrams(key)
+                self.gram_counts[key] = len(grams)
+                for gram in grams:
+                    self.grams.setdefault(gram, []).append(key)
+
+    @staticmethod
+    def _keys(names):
+        keys = [normalize(n) for n in names]
+        return tuple(filter(None, keys + [to_pinyin(k) for k in keys]))
+
+    @staticmethod
+    def _add(tables, phrase, intent, strict):
+        key = normalize(phrase)
+        for table, k in zip(tables, (key, to_pinyin(key))):
+            if not k:
+                continue
+            existing = table.setdefault(k, intent)
+            if existing is intent:
+                continue
+            if strict and existing is not None and table is tables[0]:
+                raise ValueError(f"“{phrase}” 对应多条命令: {existing.name()} / {intent.name()}")
+            table[k] = None  # 有歧义（含拼音相同的不同说法），不直接命中，留给前缀查找列出候选
+
+
+class IntentIndex:
+    """意图索引，查找只读当前快照，重新加载时整体替换引用"""
+
+    def __init__(self, path=DEFAULT_LIBRARY, lazy=False):
+        self.path = path
+        self.lazy = lazy
+        self._compiled = None
+        self._mtime = None
+        self._checked = 0.0
+        self.load()
+
+    def load(self):
+        stat = os.stat(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            library = json.load(f)
+        compiled = _Compiled(library, os.path.dirname(os.path.abspath(self.path)), self.lazy)
+        self._compiled = compiled
+        self._mtime = stat.st_mtime_ns
+        return len(compiled.intents)
+
+    def reload_if_changed(self):
+        """编码库被修改时重新加载；加载失败保留旧索引并抛出 ValueError"""
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_INTERVAL:
+            return False
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime  # 加载失败也只报告一次，等文件再次修改
+        self.load()
+        return True
+
+    def lookup(self, text):
+        """返回 (Intent, 匹配方式, 相似度)，找不到返回 None"""
+        compiled = self._compiled
+        key = normalize(text)
+        intent = compiled.exact.get(key)
+        if intent is not None:
+            return intent, 'exact', 1.0
+        if key in compiled.ambiguous:
+            return None
+        pinyin = to_pinyin(key)
+        if pinyin:
+            intent = compiled.pinyin.get(pinyin)
+            if intent is not None:
+                return intent, 'pinyin', 1.0
+        return self._fuzzy(compiled, key, pinyin)
+
+    def _fuzzy(self, compiled, key, pinyin):
+        best = None
+        for query, syllables in ((key, False), (pinyin, True)):
+            if not query:
+                continue
+            grams = _bigrams(query)
+            counts = {}
+            for gram in grams:
+                for candidate in compiled.grams.get(gram, ()):
+                    counts[candidate] = counts.get(candidate, 0) + 1
+            for candidate, shared in counts.items():
+                score = 2 * shared / (len(grams) + compiled.gram_counts[candidate])
+                if best is not None and score <= best[2]:
+                    continue
+                intent = compiled.exact.get(candidate) or compiled.pinyin.get(candidate)
+                # 模糊匹配只容忍房间和语气词上的出入：设备或动作没说出来宁可不发，
+                # 不能把电视的指令发给风扇，也不能把“关”当成“开”
+                if (_mentions(query, intent.device_keys, syllables)
+                        and _mentions(query, intent.action_keys, syllables)):
+                    best = (intent, 'fuzzy', score)
+        if best is None or best[2] < FUZZY_MIN_SCORE:
+            return None
+        return best
+
+    def ambiguous(self, text):
+        """省略了房间且多个房间都有该命令时，返回这些候选"""
+        return self._compiled.ambiguous.get(normalize(text), [])
+
+    def prefix(self, text, limit=10):
+        """列出以 text 开头的说法和对应命令，用于候选提示"""
+        compiled = self._compiled
+        key = normalize(text)
+        keys = compiled.keys
+        i = bisect.bisect_left(keys, key)
+        out = []
+        while i < len(keys) and len(out) < limit and keys[i].startswith(key):
+            out.append((keys[i], compiled.exact[keys[i]]))
+            i += 1
+        return out
+
+    def __len__(self):
+        return len(self._compiled.intents)
+
+
+# 自检用的固定读音，不依赖是否安装 pypinyin
+_SELF_TEST_READINGS = {'客': 'ke', '厅': 'ting', '电': 'dian', '视': 'shi', '音': 'yin', '量': 'liang',
+                       '加': 'jia', '减': 'jian', '风': 'feng', '扇': 'shan', '开': 'kai', '关': 'guan'}
+# (编码库中的命令, 查询, 应命中的命令或 None)
+_SELF_TEST_CASES = [
+    ('客厅电视音量加', '客厅电视音量减', None),
+    ('客厅电视音量加', '客厅电视音量加', '客厅电视音量加'),
+    ('客厅风扇开', '客厅风扇关', None),
+    ('客厅风扇开', '客厅的风扇开', '客厅风扇开'),
+]
+
+
+def self_test():
+    """模糊匹配的回归检查：动作说错时不能命中相反的命令"""
+    import tempfile
+    global lazy_pinyin
+    saved = lazy_pinyin
+    lazy_pinyin = lambda text: [_SELF_TEST_READINGS.get(c, c) for c in text]  # noqa: E731
+    failures = 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for phrase, query, expected in _SELF_TEST_CASES:
+                room, device, action = phrase[:2], phrase[2:4], phrase[4:]
+                path = os.path.join(tmp, 'library.json')
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump({'commands': [{'room': room, 'device': device, 'action': action, 'hex': '00'}]}, f)
+                match = IntentIndex(path).lookup(query)
+                got = match[0].name() if match else None
+                ok = got == expected
+                failures += not ok
+                print(f"{'通过' if ok else '失败'}: 编码库 {phrase}，查询 {query} -> {got}（应为 {expected}）")
+    finally:
+        lazy_pinyin = saved
+    return 1 if failures else 0
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='查询语音意图索引（不发送）')
+    parser.add_argument('text', nargs='*', help='要查询的文字')
+    parser.add_argument('--library', default=DEFAULT_LIBRARY, help=f'编码库文件 (默认: {DEFAULT_LIBRARY})')
+    parser.add_argument('--prefix', action='store_true', help='按前缀列出候选')
+    parser.add_argument('--self-test', action='store_true', help='运行模糊匹配的回归检查')
+    args = parser.parse_args()
+    if args.self_test:
+        return self_test()
+    if not args.text:
+        parser.error('需要要查询的文字')
+
+    start = time.perf_counter()
+    try:
+        index = IntentIndex(args.library)
+    except (OSError, ValueError) as e:
+        print(f"错误: 加载编码库失败: {e}")
+        return 1
+    print(f"已加载 {len(index)} 条命令，耗时 {(time.perf_counter() - start) * 1000:.1f}ms"
+          f"{'' if lazy_pinyin else '（未安装 pypinyin，不支持拼音匹配）'}")
+
+    for text in args.text:
+        start = time.perf_counter_ns()
+        if args.prefix:
+            result = index.prefix(text)
+            elapsed = (time.perf_counter_ns() - start) / 1000
+            print(f"{text}: {len(result)} 个候选 ({elapsed:.1f}us)")
+            for phrase, intent in result:
+                print(f"  {phrase} -> {intent}")
+            continue
+        match = index.lookup(text)
+        elapsed = (time.perf_counter_ns() - start) / 1000
+        if match is None:
+            candidates = index.ambiguous(text)
+            if candidates:
+                print(f"{text}: 有歧义，可选 {' / '.join(c.name() for c in candidates)} ({elapsed:.1f}us)")
+            else:
+                print(f"{text}: 未找到 ({elapsed:.1f}us)")
+        else:
+            intent, method, score = match
+            print(f"{text}: {intent} [{method} {score:.2f}] 指令帧 {len(intent.compile())} 字节 ({elapsed:.1f}us)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""红外编码数据的时序编解码
+
+模块的红外编码数据是一串码元时长（单位微秒），第一个码元为低电平（载波）时长，
+之后高低电平交替。每个时长除以压缩比 8 后按变长字节存储：低 7 位为数据，
+最高位表示后面还有字节，低位在前，最多 3 个字节。
+"""
+
+import math
+
+COMPRESSION = 8
+MAX_VARINT_BYTES = 3
+MAX_UNITS = (1 << (7 * MAX_VARINT_BYTES)) - 1
+
+# 空白时长超过典型位空白的倍数（且不少于 GAP_MIN_US）视为帧间隔
+GAP_FACTOR = 3
+GAP_MIN_US = 4000
+# 引导码载波：比其余载波长 HEADER_FACTOR 倍以上，且出现次数不超过码元对数的 HEADER_SHARE
+HEADER_FACTOR = 2
+HEADER_SHARE = 0.2
+# 两类位时长的比值超过该值才认为这一维在编码数据
+MODULATION_RATIO = 1.6
+# 末帧位数不超过首帧的 1/REPEAT_FRAME_SHARE 时视为重复帧，按住按键时只重复它
+REPEAT_FRAME_SHARE = 4
+# 编码以载波结尾且没有帧间隔可参考时，重复之间插入的空白
+REPEAT_GAP_US = 40000
+# 重复帧的发送周期（帧起点到下一帧起点）无法从学习到的编码中测出时使用 NEC 的周期
+REPEAT_PERIOD_US = 108000
+
+
+def decode_timings(data):
+    """把红外编码数据解码为码元时长列表 (微秒)"""
+    durations = []
+    value = 0
+    shift = 0
+    count = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        count += 1
+        if byte & 0x80:
+            if count >= MAX_VARINT_BYTES:
+                raise ValueError("码元超过 3 个字节")
+            continue
+        durations.append(value * COMPRESSION)
+        value = 0
+        shift = 0
+        count = 0
+    if count:
+        raise ValueError("编码数据在码元中间结束")
+    return durations
+
+
+def encode_timings(durations):
+    """把码元时长列表 (微秒) 编码为模块的红外编码数据"""
+    out = bytearray()
+    for us in durations:
+        units = min(max(int(round(us / COMPRESSION)), 0), MAX_UNITS)
+        while units >= 0x80:
+            out.append((units & 0x7F) | 0x80)
+            units >>= 7
+        out.append(units)
+    return bytes(out)
+
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0
+
+
+def _split_threshold(values):
+    """在两簇数值之间取阈值：排序后相邻比值最大处的中点"""
+    ordered = sorted(values)
+    best_ratio, threshold = 1.0, None
+    for a, b in zip(ordered, ordered[1:]):
+        if a > 0 and b / a > best_ratio:
+            best_ratio, threshold = b / a, (a + b) / 2
+    return best_ratio, threshold
+
+
+def _clusters(values, ratio=MODULATION_RATIO):
+    """排序后在相邻比值超过 ratio 处切开，返回各簇 (最小值, 最大值, 个数)"""
+    ordered = sorted(values)
+    groups = [[ordered[0]]]
+    for a, b in zip(ordered, ordered[1:]):
+        if a > 0 and b / a > ratio:
+            groups.append([])
+        groups[-1].append(b)
+    return [(g[0], g[-1], len(g)) for g in groups]
+
+
+def parse_frames(durations):
+    """
+    把码元时长解析为位序列
+
+    支持脉冲间隔调制（载波定长、空白区分 0/1，如 NEC）和脉冲宽度调制（载波区分 0/1）。
+    返回字典：
+        kind:    'pd' 或 'pw'
+        zero/one: 0/1 位的 (载波, 空白) 平均时长
+        trailer: 脉冲间隔调制每帧末尾的结束载波时长
+        frames:  每帧 {'header': (载波, 空白) 或 None, 'bits': [...], 'gap': 帧后空白或 None,
+                  'span': 该帧在 durations 中的 (起, 止) 下标，含帧后空白}
+    无法识别时抛出 ValueError
+    """
+    if len(durations) < 4:
+        raise ValueError("码元太少，无法解析")
+
+    pairs = [(durations[i], durations[i + 1] if i + 1 < len(durations) else None)
+             for i in range(0, len(durations), 2)]
+    # 最长的一簇载波若明显更长且数量很少，就是引导码；脉冲宽度调制的 1 位虽然也长，但数量多
+    header_min = None
+    groups = _clusters([m for m, _ in pairs])
+    if len(groups) >= 2:
+        top, below = groups[-1], groups[-2]
+        if top[0] > below[1] * HEADER_FACTOR and top[2] <= len(pairs) * HEADER_SHARE:
+            header_min = top[0]
+
+    def header_like(mark):
+        return header_min is not None and mark >= header_min
+
+    bit_mark = _median([m for m, _ in pairs if not header_like(m)])
+    bit_space = _median([s for m, s in pairs if s is not None and not header_like(m)])
+    gap_limit = max(bit_space * GAP_FACTOR, GAP_MIN_US)
+
+    # 按帧间隔切分
+    raw_frames = []
+    current = []
+    for mark, space in pairs:
+        is_header = header_like(mark)
+        current.append((mark, space, is_header))
+        if space is None or (space > gap_limit and not is_header):
+            raw_frames.append(current)
+            current = []
+    if current:
+        raw_frames.append(current)
+
+    # 判断调制方式：只用帧内普通位（不含引导码和帧末尾）的时长
+    body = [(m, s) for frame in raw_frames for m, s, h in frame[:-1] if not h]
+    if not body:
+        raise ValueError("没有可解析的数据位")
+    mark_ratio, mark_threshold = _split_threshold([m for m, _ in body])
+    space_ratio, space_threshold = _split_threshold([s for _, s in body])
+
+    # 载波长度分两类时按脉冲宽度解析，这样每帧最后一位也能保留下来
+    if mark_ratio >= MODULATION_RATIO:
+        kind = 'pw'
+    elif space_ratio >= MODULATION_RATIO:
+        kind = 'pd'
+    else:
+        raise ValueError("无法识别的调制方式（可能是曼彻斯特编码）")
+
+    frames = []
+    zeros, ones, trailers = [], [], []
+    start = 0
+    for raw in raw_frames:
+        end = min(start + 2 * len(raw), len(durations))
+        span = (start, end)
+        start = end
+        header = None
+        if raw[0][2]:
+            header = (raw[0][0], raw[0][1])
+            raw = raw[1:]
+        gap = raw[-1][1] if raw else None
+        bits = []
+        if kind == 'pd':
+            for mark, space in ((m, s) for m, s, _ in raw[:-1]):
+                bit = 1 if space > space_threshold else 0
+                bits.append(bit)
+                (ones if bit else zeros).append((mark, space))
+            if raw:
+                trailers.append(raw[-1][0])
+        else:
+            for i, (mark, space, _) in enumerate(raw):
+                bit = 1 if mark > mark_threshold else 0
+                bits.append(bit)
+                if i < len(raw) - 1:
+                    (ones if bit else zeros).append((mark, space))
+        frames.append({'header': header, 'bits': bits, 'gap': gap, 'span': span})
+
+    def average(group, fallback):
+        if not group:
+            return fallback
+        return (int(sum(m for m, _ in group) / len(group)), int(sum(s for _, s in group) / len(group)))
+
+    zero = average(zeros, None)
+    one = average(ones, None)
+    if zero is None or one is None:
+        raise ValueError("数据位中只出现了一种取值")
+    return {
+        'kind': kind,
+        'zero': zero,
+        'one': one,
+        'trailer': int(sum(trailers) / len(trailers)) if trailers else bit_mark,
+        'frames': frames,
+    }
+
+
+def build_durations(code):
+    """parse_frames 结果的逆过程，frames 中的位可以被修改"""
+    zero, one = code['zero'], code['one']
+    durations = []
+    for frame in code['frames']:
+        if frame['header']:
+            durations.extend(frame['header'])
+        bits = frame['bits']
+        if code['kind'] == 'pd':
+            for bit in bits:
+                durations.extend(one if bit else zero)
+            durations.append(code['trailer'])
+        else:
+            for bit in bits:
+                durations.extend(one if bit else zero)
+            if bits:
+                durations.pop()  # 最后一位的空白由帧间隔代替
+        if frame['gap'] is not None:
+            durations.append(frame['gap'])
+    return durations
+
+
+def is_repeat_frame(frame, first):
+    """frame 相对首帧 first 是否为短的重复帧（如 NEC 的重复引导码，没有数据位）"""
+    return len(frame['bits']) * REPEAT_FRAME_SHARE <= len(first['bits'])
+
+
+def strip_repeat_frames(frames):
+    """去掉末尾的重复帧，按住时长不同的同一按键得到相同的数据帧"""
+    end = len(frames)
+    while end > 1 and is_repeat_frame(frames[end - 1], frames[0]):
+        end -= 1
+    return frames[:end]
+
+
+def _repeat_gap(durations, frames):
+    """以载波结尾的重复帧之后的空白：补齐到学习到的帧周期，测不出时按 REPEAT_PERIOD_US"""
+    start = frames[-1]['span'][0]
+    length = sum(durations[start:])
+    period = sum(durations[frames[-2]['span'][0]:start])
+    if period <= length:
+        period = REPEAT_PERIOD_US
+    return max(period - length, GAP_MIN_US)
+
+
+def repeat_unit(durations):
+    """
+    拆出按住按键时重复发送的部分，返回 (首次发送, 重复单元)，两者都以空白结尾
+
+    编码末尾带有短的重复帧（如 NEC 的重复引导码）时只重复该帧，并按原来的帧周期补齐空白，
+    否则重复整个编码。
+    """
+    durations = list(durations)
+    try:
+        code = parse_frames(durations)
+    except ValueError:
+        code = None
+    frames = code['frames'] if code else []
+    gaps = [f['gap'] for f in frames if f['gap'] is not None]
+    short = len(frames) >= 2 and is_repeat_frame(frames[-1], frames[0])
+    if len(durations) % 2:
+        # 以载波结尾，补上帧间隔再重复；重复帧之前的空白是数据帧之后的，比重复帧之间的短得多
+        if short:
+            durations.append(_repeat_gap(durations, frames))
+        else:
+            durations.append(max(gaps) if gaps else REPEAT_GAP_US)
+    if short:
+        return durations, durations[frames[-1]['span'][0]:]
+    return durations, durations
+
+
+def hold_payloads(data, repeat=0, hold_us=0, max_bytes=None):
+    """
+    生成按住按键的外部编码数据：首次发送后接重复单元，重复次数取 repeat 和按住时长所需次数的较大值。
+    超过 max_bytes 时按重复单元边界拆成尽量少的几段，每段都是可以单独发送的完整编码。
+    返回 (各段编码数据, 重复次数)
+    """
+    base, unit = repeat_unit(decode_timings(data))
+    count = repeat
+    if hold_us:
+        count = max(count, math.ceil((hold_us - sum(base)) / sum(unit)))
+    count = max(count, 0)
+
+    # 每个码元的编码长度互不影响，可以直接相加；每段末尾的空白不必发送
+    def full_size(durations):
+        return len(encode_timings(durations))
+
+    unit_size = full_size(unit)
+    unit_tail = full_size(unit[-1:])
+    if max_bytes is not None:
+        base_size = full_size(base[:-1])
+        if base_size > max_bytes:
+            raise ValueError(f"编码本身 {base_size} 字节，超过单帧上限 {max_bytes} 字节")
+        if unit_size - unit_tail > max_bytes:
+            raise ValueError(f"重复单元 {unit_size - unit_tail} 字节，超过单帧上限 {max_bytes} 字节")
+
+    segments = [list(base)]
+    current = full_size(base)
+    for _ in range(count):
+        if max_bytes is None or current + unit_size - unit_tail <= max_bytes:
+            segments[-1].extend(unit)
+            current += unit_size
+        else:
+            segments.append(list(unit))
+            current = unit_size
+    return [encode_timings(seg[:-1]) for seg in segments], count
+
+
+def bits_to_bytes(bits, lsb_first=True):
+    """按 8 位一组转成字节，末尾不足 8 位的部分也算一个字节"""
+    out = []
+    for start in range(0, len(bits), 8):
+        value = 0
+        for k, bit in enumerate(bits[start:start + 8]):
+            value |= bit << (k if lsb_first else 7 - k)
+        out.append(value)
+    return out
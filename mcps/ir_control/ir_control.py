@@ -8,6 +8,8 @@ import argparse
 # 如果启用了 uart1，通常是 /dev/ttyS1
 SERIAL_PORT = '/dev/ttyS1'
 BAUD_RATE = 115200
+# 模块外部编码缓冲约 800 字节，扣除帧头尾 7 字节后单帧最多携带的编码数据
+MAX_EXTERNAL_DATA = 793
 
 def calculate_checksum(address, afn, data):
     """计算校验和"""
@@ -42,6 +44,28 @@ def build_frame(afn, data=b''):
     
     return bytes(command)
 
+ACTION_KINDS = ('internal', 'hex', 'file', 'ac')
+
+def build_action_frame(kind, value, ac_profile='ac_profile.json', ac_models=None):
+    """把动作 (internal / hex / file / ac) 转成可以直接写串口的指令帧，ac_models 用于缓存推断好的空调模型"""
+    if kind == 'internal':
+        index = int(value)
+        if not 0 <= index <= 6:
+            raise ValueError("内部编码索引必须在 0-6 之间")
+        return build_frame(0x12, data=bytes([index]))
+    if kind == 'hex':
+        return build_frame(0x22, data=bytes.fromhex(value.replace(' ', '')))
+    if kind == 'file':
+        with open(value, 'r') as f:
+            return build_frame(0x22, data=bytes.fromhex(f.read().strip().replace(' ', '')))
+    if kind == 'ac':
+        import ac_codec
+        models = ac_models if ac_models is not None else {}
+        if ac_profile not in models:
+            models[ac_profile] = ac_codec.ACModel.from_profile(ac_profile)
+        return build_frame(0x22, data=models[ac_profile].encode(ac_codec.parse_state(value)))
+    raise ValueError(f"未知的动作类型: {kind} (可选 {' / '.join(ACTION_KINDS)})")
+
 def parse_args():
     parser = argparse.ArgumentParser(description='红外学习模块控制器')
     parser.add_argument('--port', default=SERIAL_PORT, help=f'串口设备 (默认: {SERIAL_PORT})')
@@ -59,6 +83,11 @@ def parse_args():
     parser.add_argument('--send-external-file', metavar='FILENAME',
                        help='从文件发送外部编码')
     
+    parser.add_argument('--repeat', type=int, metavar='N',
+                       help='外部编码发送后再重复 N 次 (按住按键), 与 --send-external-* / --ac-send 一起使用')
+    parser.add_argument('--hold', type=float, metavar='SECONDS',
+                       help='按住按键的时长 (秒), 自动计算重复次数')
+    
     # 系统设置
     parser.add_argument('--set-baud', type=int, choices=[0,1,2,3,4],
                        help='设置波特率 (0=9600, 1=19200, 2=38400, 3=57600, 4=115200)')
@@ -83,9 +112,102 @@ def parse_args():
                        help='写入内部存储编码 (索引 0-6, 十六进制数据)')
     parser.add_argument('--read-internal', type=int, metavar='INDEX',
                        help='读取内部存储编码 (索引 0-6)')
+
+    # 空调状态编码
+    parser.add_argument('--ac-profile', default='ac_profile.json', metavar='FILE',
+                       help='空调学习样本文件 (默认: ac_profile.json)')
+    parser.add_argument('--ac-learn', metavar='STATE',
+                       help='学习一个空调状态的编码并加入样本, 如 "mode=cool,temp=24,fan=auto"')
+    parser.add_argument('--ac-send', metavar='STATE',
+                       help='根据样本推断的帧结构生成并发送空调状态编码')
+    parser.add_argument('--ac-layout', action='store_true',
+                       help='显示由样本推断出的空调帧结构')
+
+    # 连续学习
+    parser.add_argument('--sniff', action='store_true',
+                       help='连续学习模式: 反复进入外部学习, 每次按键保存一个编码, Ctrl+C 结束')
+    parser.add_argument('--sniff-dir', default='.', metavar='DIR',
+                       help='连续学习的编码保存目录, 也用于查重 (默认: 当前目录)')
+    parser.add_argument('--labels', metavar='NAMES',
+                       help='按顺序提示的按键名称, 逗号分隔或 @文件 (每行一个), 录完自动结束')
+    parser.add_argument('--sniff-count', type=int, metavar='N', help='录到 N 个新编码后结束')
+
+    # 语音意图
+    parser.add_argument('--intent', metavar='TEXT',
+                       help='按编码库中的房间/设备/动作查找并发送, 如 "客厅电视音量加"')
+    parser.add_argument('--library', default='ir_library.json', metavar='FILE',
+                       help='意图编码库文件 (默认: ir_library.json)')
+
+    # 串口收发记录与回放
+    parser.add_argument('--record-trace', metavar='FILE',
+                       help='把串口收发的字节和时间戳记录到文件 (可用 serial_trace.py dump 查看)')
+    parser.add_argument('--replay-trace', metavar='FILE',
+                       help='不打开串口，用记录文件回放模块的回复')
+    parser.add_argument('--replay-speed', type=float, default=1.0, metavar='FACTOR',
+                       help='回放速度倍数 (默认 1 为原始时序, 0 为不等待)')
     
     return parser.parse_args()
 
+def learn_external_code(ser):
+    """进入外部学习模式并等待上报的编码，返回 (编码数据, 错误信息)"""
+    command = build_frame(0x20)
+    ser.write(command)
+    print("指令已发送。请在10秒内按遥控器按键。")
+
+    response = ser.read(500)
+    if response and len(response) >= 7 and response[0] == 0x68 and response[4] == 0x22:
+        data = response[5:-2]
+        if data:
+            return data, None
+        return None, "错误: 提取的数据为空"
+    elif response and len(response) >= 8 and response[0] == 0x68 and response[4] == 0x01:
+        status = response[5]
+        if status != 0:
+            return None, f"进入学习模式失败，状态码: {status}"
+        # 应答帧之后可能已经跟着学习结果
+        response2 = response[8:]
+        if not response2:
+            print("等待学习结果...")
+            response2 = ser.read(500)
+        if response2 and len(response2) >= 7 and response2[0] == 0x68 and response2[4] == 0x22:
+            data = response2[5:-2]
+            if data:
+                return data, None
+            return None, "错误: 第二次响应中的数据为空"
+        return None, "未收到学习成功的数据帧"
+    else:
+        return None, f"未收到有效响应: {response.hex(' ') if response else '无响应'}"
+
+def send_external(ser, data, args):
+    """发送外部编码；指定 --repeat / --hold 时把重复部分拼进同一段编码，超过单帧上限才拆成几帧"""
+    if not args.repeat and not args.hold:
+        command = build_frame(0x22, data=data)
+        ser.write(command)
+
+        response = ser.read(8)
+        if response:
+            return f"收到回复: {response.hex(' ')}"
+        return "指令已发送"
+
+    import ir_codec
+    try:
+        payloads, count = ir_codec.hold_payloads(data, repeat=args.repeat or 0,
+                                                 hold_us=int((args.hold or 0) * 1e6),
+                                                 max_bytes=MAX_EXTERNAL_DATA)
+    except ValueError as e:
+        return f"错误: {e}"
+    sent = 0
+    for i, payload in enumerate(payloads):
+        command = build_frame(0x22, data=payload)
+        ser.write(command)
+        sent += len(command)
+        response = ser.read(8)
+        if not response:
+            return f"错误: 第 {i + 1}/{len(payloads)} 帧未收到回复"
+    separate = len(build_frame(0x22, data=data)) * (count + 1)
+    return (f"已发送 {len(payloads)} 帧 (重复 {count} 次), 串口 {sent} 字节 "
+            f"(逐次发送需 {count + 1} 帧 {separate} 字节)")
+
 def execute_command(ser, args):
     """执行单个命令并返回结果"""
     try:
@@ -121,40 +243,35 @@ def execute_command(ser, args):
 
         elif args.learn_external:
             print("进入外部学习模式...")
-            command = build_frame(0x20)
-            ser.write(command)
-            print("指令已发送。请在10秒内按遥控器按键。")
-            
-            response = ser.read(500)
-            if response and len(response) >= 7 and response[0] == 0x68 and response[4] == 0x22:
-                data = response[5:-2]
-                if data:
-                    filename = f"ir_code_{int(time.time())}.hex"
-                    with open(filename, 'w') as f:
-                        f.write(data.hex(' '))
-                    return f"成功保存到文件: {os.path.abspath(filename)} (数据长度: {len(data)} 字节)"
-                else:
-                    return "错误: 提取的数据为空"
-            elif response and len(response) >= 8 and response[0] == 0x68 and response[4] == 0x01:
-                status = response[5]
-                if status == 0:
-                    print("等待学习结果...")
-                    response2 = ser.read(500)
-                    if response2 and len(response2) >= 7 and response2[0] == 0x68 and response2[4] == 0x22:
-                        data = response2[5:-2]
-                        if data:
-                            filename = f"ir_code_{int(time.time())}.hex"
-                            with open(filename, 'w') as f:
-                                f.write(data.hex(' '))
-                            return f"成功保存到文件: {os.path.abspath(filename)} (数据长度: {len(data)} 字节)"
-                        else:
-                            return "错误: 第二次响应中的数据为空"
-                    else:
-                        return "未收到学习成功的数据帧"
-                else:
-                    return f"进入学习模式失败，状态码: {status}"
-            else:
-                return f"未收到有效响应: {response.hex(' ') if response else '无响应'}"
+            data, error = learn_external_code(ser)
+            if error:
+                return error
+            filename = f"ir_code_{int(time.time())}.hex"
+            with open(filename, 'w') as f:
+                f.write(data.hex(' '))
+            return f"成功保存到文件: {os.path.abspath(filename)} (数据长度: {len(data)} 字节)"
+
+        elif args.ac_learn:
+            import ac_codec
+            try:
+                state = ac_codec.parse_state(args.ac_learn)
+            except ValueError as e:
+                return f"错误: {e}"
+            print(f"学习空调状态 {ac_codec.state_key(state)}...")
+            data, error = learn_external_code(ser)
+            if error:
+                return error
+            count = ac_codec.add_sample(args.ac_profile, state, data)
+            return f"已保存到 {os.path.abspath(args.ac_profile)} (共 {count} 个样本, 数据长度: {len(data)} 字节)"
+
+        elif args.ac_send:
+            import ac_codec
+            try:
+                data = ac_codec.ACModel.from_profile(args.ac_profile).encode(ac_codec.parse_state(args.ac_send))
+            except ValueError as e:
+                return f"错误: {e}"
+            print(f"发送空调状态 {args.ac_send} (数据长度: {len(data)} 字节)...")
+            return send_external(ser, data, args)
 
         elif args.send_external_hex:
             try:
@@ -163,13 +280,7 @@ def execute_command(ser, args):
                 return "错误: 无效的十六进制数据"
             
             print("发送外部编码...")
-            command = build_frame(0x22, data=data)
-            ser.write(command)
-            
-            response = ser.read(8)
-            if response:
-                return f"收到回复: {response.hex(' ')}"
-            return "指令已发送"
+            return send_external(ser, data, args)
 
         elif args.send_external_file:
             try:
@@ -182,9 +293,41 @@ def execute_command(ser, args):
                 return "错误: 文件中的数据格式无效"
             
             print(f"从文件 '{args.send_external_file}' 发送外部编码...")
-            command = build_frame(0x22, data=data)
-            ser.write(command)
-            
+            return send_external(ser, data, args)
+
+        elif args.sniff:
+            import ir_sniffer
+            try:
+                labels = ir_sniffer.parse_labels(args.labels)
+            except OSError as e:
+                return f"错误: 无法读取按键名称文件: {e}"
+            ring = ir_sniffer.sniff(ser, args.sniff_dir, labels, args.sniff_count)
+            saved = [c for c in ring if c.path]
+            lines = [f"连续学习结束，本次保存 {len(saved)} 个编码 (最近 {len(ring)} 次按键中)"]
+            lines += [f"  {c.name}: {c.path}" for c in saved]
+            return '\n'.join(lines)
+
+        elif args.intent:
+            import intent_index
+            # 单次调用只发一条命令：只建说法索引，指令帧只为命中的命令生成
+            try:
+                index = intent_index.IntentIndex(args.library, lazy=True)
+            except (OSError, ValueError) as e:
+                return f"错误: 加载编码库失败: {e}"
+            match = index.lookup(args.intent)
+            if match is None:
+                candidates = index.ambiguous(args.intent)
+                if candidates:
+                    return f"错误: '{args.intent}' 有歧义，可选: {' / '.join(c.name() for c in candidates)}"
+                return f"错误: 编码库中没有与 '{args.intent}' 匹配的命令"
+            intent, method, score = match
+            try:
+                frame = intent.compile()
+            except (OSError, ValueError) as e:
+                return f"错误: 命令 {intent.name()} 无法生成指令帧: {e}"
+            print(f"匹配到 {intent.name()} ({method} {score:.2f})，发送 {intent.kind}={intent.value}...")
+            ser.write(frame)
+
             response = ser.read(8)
             if response:
                 return f"收到回复: {response.hex(' ')}"
@@ -370,6 +513,29 @@ def execute_command(ser, args):
     except Exception as e:
         return f"错误: {str(e)}"
 
+def open_port(args):
+    """按参数打开串口或回放记录文件，需要时包装上收发记录，失败返回 None"""
+    if args.replay_trace:
+        import serial_trace
+        try:
+            ser = serial_trace.ReplaySerial(args.replay_trace, args.replay_speed)
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法读取记录文件 {args.replay_trace}. {e}")
+            return None
+        print(f"回放串口记录 {args.replay_trace} (速度 x{args.replay_speed:g})")
+    else:
+        try:
+            ser = serial.Serial(args.port, args.baud, timeout=2)
+            print(f"成功打开串口 {args.port}")
+        except serial.SerialException as e:
+            print(f"错误: 无法打开串口 {args.port}. {e}")
+            return None
+    if args.record_trace:
+        import serial_trace
+        ser = serial_trace.RecordingSerial(ser, args.record_trace)
+        print(f"串口收发记录到 {args.record_trace}")
+    return ser
+
 def main():
     args = parse_args()
     
@@ -378,33 +544,42 @@ def main():
                 args.send_external_hex, args.send_external_file, args.set_baud is not None,
                 args.get_baud, args.set_address, args.get_address, args.reset, args.format,
                 args.set_power_send, args.get_power_send is not None, args.set_power_delay is not None,
-                args.get_power_delay, args.write_internal, args.read_internal is not None]):
+                args.get_power_delay, args.write_internal, args.read_internal is not None,
+                args.ac_learn, args.ac_send, args.ac_layout, args.intent, args.sniff]):
         # 进入交互模式
-        interactive_mode()
+        ser = open_port(args)
+        if ser is None:
+            print("请检查：1. 硬件连接是否正确？ 2. 是否已使用 armbian-config 启用 uart1？")
+            return
+        interactive_mode(ser)
+        return
+
+    # 推断帧结构不需要串口
+    if args.ac_layout:
+        import ac_codec
+        import json
+        try:
+            layout = ac_codec.ACModel.from_profile(args.ac_profile).layout()
+        except ValueError as e:
+            print(f"错误: {e}")
+            return
+        print(json.dumps(layout, ensure_ascii=False, indent=2))
         return
     
     # 命令行模式
-    try:
-        ser = serial.Serial(args.port, args.baud, timeout=2)
-        print(f"成功打开串口 {args.port}")
-    except serial.SerialException as e:
-        print(f"错误: 无法打开串口 {args.port}. {e}")
+    ser = open_port(args)
+    if ser is None:
         return
 
     result = execute_command(ser, args)
     print(result)
-    
+
+    if getattr(ser, 'mismatches', None):
+        print(f"警告: 有 {len(ser.mismatches)} 次写入与记录不一致")
     ser.close()
 
-def interactive_mode():
-    """原来的交互模式代码"""
-    try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=2)
-        print(f"成功打开串口 {SERIAL_PORT}")
-    except serial.SerialException as e:
-        print(f"错误: 无法打开串口 {SERIAL_PORT}. {e}")
-        print("请检查：1. 硬件连接是否正确？ 2. 是否已使用 armbian-config 启用 uart1？")
-        return
+def interactive_mode(ser):
+    """原来的交互模式代码，ser 为 main() 打开的串口（可能带收发记录）"""
 
     # 获取并打印当前波特率
     print("\n[查询] 正在获取模块当前波特率...")
@@ -0,0 +1,188 @@
+"""连续学习模式：一次会话录下整个遥控器
+
+反复进入外部学习模式（AFN=20H），每收到一次上报的编码就依次经过生成器流水线：
+    raw_codes   重新进入学习模式并读取上报的编码
+    decoded     解码为码元时长，能识别调制方式时解析出位序列
+    fingerprinted  计算指纹：按位序列（忽略计时误差和按住时长），无法解析时按量化后的时长
+    deduped     与编码目录中已有的编码和本次会话已录的编码比对
+结果保存为 .hex 文件（与 --learn-external 格式相同），并放入有上限的内存环形缓冲。
+给出按键名称序列时按顺序提示，按错（与已录编码相同）会重新提示同一个按键。
+"""
+
+import math
+import os
+import re
+import time
+from collections import deque
+
+import ir_codec
+from ir_control import build_frame
+from serial_trace import REC_FRAME, FrameScanner
+
+# 模块学习模式约 10 秒无按键自动退出，超过这个时间没有上报就重新进入
+LEARN_REARM_SECONDS = 10
+READ_SIZE = 500
+RING_SIZE = 64
+# 无法按位解析时，时长量化到该比例的对数刻度后再比较
+TIMING_TOLERANCE = 0.15
+
+
+class Capture:
+    """一次捕获到的按键"""
+
+    __slots__ = ('data', 'time', 'durations', 'code', 'fingerprint', 'duplicate_of', 'name', 'path')
+
+    def __init__(self, data):
+        self.data = data
+        self.time = time.time()
+        self.durations = None
+        self.code = None
+        self.fingerprint = None
+        self.duplicate_of = None
+        self.name = None
+        self.path = None
+
+    def describe(self):
+        if self.code:
+            bits = sum(len(f['bits']) for f in self.code['frames'])
+            return f"{self.code['kind']} {len(self.code['frames'])} 帧 {bits} 位, {len(self.data)} 字节"
+        return f"{len(self.durations or [])} 个码元, {len(self.data)} 字节"
+
+
+def raw_codes(ser, stop=None):
+    """不断进入外部学习模式，产出每次上报的编码数据；stop() 返回 True 时结束"""
+    scanner = FrameScanner()
+    while stop is None or not stop():
+        ser.write(build_frame(0x20))
+        deadline = time.monotonic() + LEARN_REARM_SECONDS
+        received = None
+        while received is None and time.monotonic() < deadline:
+            data = ser.read(READ_SIZE)
+            if not data:
+                continue
+            for kind, frame in scanner.feed(data):
+                if kind != REC_FRAME:
+                    continue
+                if frame[4] == 0x01 and frame[5] != 0:
+                    print(f"进入学习模式失败，状态码: {frame[5]}，稍后重试")
+                    time.sleep(1)
+                    deadline = 0
+                elif frame[4] == 0x22 and len(frame) > 7:
+                    received = frame[5:-2]
+        if received is not None:
+            yield received
+
+
+def decoded(stream):
+    for data in stream:
+        capture = Capture(data)
+        try:
+            capture.durations = ir_codec.decode_timings(data)
+            capture.code = ir_codec.parse_frames(capture.durations)
+        except ValueError:
+            pass
+        yield capture
+
+
+def fingerprint(capture):
+    if capture.code:
+        # 按住时间不同，末尾的重复帧（如 NEC 没有数据位的重复引导码）个数不同，
+        # 有的遥控器则是整帧重发：先去掉重复帧，再合并连续相同的帧
+        frames = []
+        for frame in ir_codec.strip_repeat_frames(capture.code['frames']):
+            bits = ''.join(map(str, frame['bits']))
+            if not frames or frames[-1] != bits:
+                frames.append(bits)
+        return f"{capture.code['kind']}:" + '|'.join(frames)
+    if capture.durations:
+        step = 1 + TIMING_TOLERANCE
+        buckets = [round(math.log(max(d, 1), step)) for d in capture.durations]
+        return 'raw:' + ','.join(map(str, buckets))
+    return 'hex:' + capture.data.hex()
+
+
+def fingerprinted(captures):
+    for capture in captures:
+        capture.fingerprint = fingerprint(capture)
+        yield capture
+
+
+def deduped(captures, known):
+    """known: 指纹 -> 名称，消费方保存新编码后负责加入"""
+    for capture in captures:
+        capture.duplicate_of = known.get(capture.fingerprint)
+        yield capture
+
+
+def load_known(store_dir):
+    """已有 .hex 编码文件的指纹 -> 文件名"""
+    known = {}
+    if not os.path.isdir(store_dir):
+        return known
+    for filename in sorted(os.listdir(store_dir)):
+        if not filename.endswith('.hex'):
+            continue
+        try:
+            with open(os.path.join(store_dir, filename), 'r') as f:
+                data = bytes.fromhex(f.read().strip().replace(' ', ''))
+        except (OSError, ValueError):
+            continue
+        capture = next(decoded([data]))
+        known.setdefault(fingerprint(capture), filename[:-4])
+    return known
+
+
+def parse_labels(text):
+    """按键名称序列：逗号分隔，或 @文件 (每行一个)"""
+    if not text:
+        return []
+    if text.startswith('@'):
+        with open(text[1:], 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [label.strip() for label in text.split(',') if label.strip()]
+
+
+def _filename(name):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name)
+
+
+def sniff(ser, store_dir='.', labels=None, count=None, ring_size=RING_SIZE):
+    """连续学习，返回本次会话的环形缓冲 (最近 ring_size 个 Capture，含重复的)；Ctrl+C 正常结束"""
+    os.makedirs(store_dir, exist_ok=True)
+    known = load_known(store_dir)
+    labels = list(labels or [])
+    ring = deque(maxlen=ring_size)
+    saved = 0
+    target = len(labels) if labels else count
+
+    def done():
+        return target is not None and saved >= target
+
+    def prompt():
+        if labels and saved < len(labels):
+            print(f"请按 [{labels[saved]}] ({saved + 1}/{len(labels)})")
+
+    print(f"连续学习模式，编码保存到 {os.path.abspath(store_dir)}（已有 {len(known)} 个编码），按 Ctrl+C 结束")
+    prompt()
+    try:
+        for capture in deduped(fingerprinted(decoded(raw_codes(ser, done))), known):
+            ring.append(capture)
+            if capture.duplicate_of is not None:
+                print(f"  与已有编码 {capture.duplicate_of} 相同，跳过 ({capture.describe()})")
+                prompt()
+                continue
+            name = labels[saved] if labels else f"ir_code_{int(capture.time)}_{saved + 1}"
+            path = os.path.join(store_dir, _filename(name) + '.hex')
+            if os.path.exists(path):
+                path = os.path.join(store_dir, f"{_filename(name)}_{int(capture.time)}.hex")
+            with open(path, 'w') as f:
+                f.write(capture.data.hex(' '))
+            capture.name = name
+            capture.path = path
+            known[capture.fingerprint] = name
+            saved += 1
+            print(f"  已保存 {os.path.basename(path)} ({capture.describe()})")
+            prompt()
+    except KeyboardInterrupt:
+        print()
+    return ring
@@ -0,0 +1,323 @@
+"""串口收发记录与按原始时序回放
+
+RecordingSerial 包装已打开的串口，把每次写入和读取的字节连同单调时钟时间戳记录到
+紧凑的二进制文件中，并按 68 ... 16 帧格式切分出帧边界（含校验结果和帧外的乱码字节）。
+ReplaySerial 读取记录文件充当串口，按原始时序或加速回放模块的回复，
+现场抓到的问题可以离线复现，也可以当作固定的延迟基准和回归用例。
+
+文件格式（整数均为小端）：
+    文件头  'IRTR' | 版本(1) | 保留(1) | 端口名长度(2) | 开始时间 ns(8) | 波特率(4) | 端口名
+    记录    类型(1) | 距上一条记录开始的微秒 | 耗时微秒 | 参数 | 数据长度 | 数据
+除类型外都是与红外编码相同的变长整数（每字节 7 位，低位在前），不限字节数。
+
+用法：
+    python3 serial_trace.py dump trace.bin
+"""
+
+import os
+import struct
+import sys
+import time
+
+MAGIC = b'IRTR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sBxHqI')
+
+REC_WRITE = 0x01     # 参数: 0
+REC_READ = 0x02      # 参数: 请求的字节数，数据为实际读到的字节（超时为空）
+REC_RESET = 0x03     # reset_input_buffer
+REC_FRAME = 0x04     # 参数: 方向；数据: 帧长度(变长) + AFN + 校验是否正确
+REC_GARBAGE = 0x05   # 参数: 方向；数据: 帧外被丢弃的字节
+REC_CLOSE = 0x06
+REC_PARTIAL = 0x07   # 参数: 方向；数据: 关闭时仍未收完的帧
+
+DIR_TX = 1
+DIR_RX = 2
+DIR_NAMES = {DIR_TX: '→', DIR_RX: '←'}
+REC_NAMES = {REC_WRITE: '写', REC_READ: '读', REC_RESET: '清空', REC_FRAME: '帧', REC_GARBAGE: '乱码',
+             REC_CLOSE: '关闭', REC_PARTIAL: '未完成帧'}
+
+FRAME_HEAD = 0x68
+FRAME_TAIL = 0x16
+MIN_FRAME = 7
+MAX_FRAME = 1024
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def _read_varint(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("记录文件在变长整数中间结束")
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+class FrameScanner:
+    """从字节流中切出 68 ... 16 帧，帧外的字节作为乱码返回"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        """返回 [(类型, 字节), ...]，类型为 REC_FRAME 或 REC_GARBAGE"""
+        self.buf.extend(data)
+        out = []
+        garbage = bytearray()
+        while self.buf:
+            if self.buf[0] != FRAME_HEAD:
+                garbage.append(self.buf.pop(0))
+                continue
+            if len(self.buf) < 3:
+                break
+            length = self.buf[1] | (self.buf[2] << 8)
+            if not MIN_FRAME <= length <= MAX_FRAME:
+                garbage.append(self.buf.pop(0))
+                continue
+            if len(self.buf) < length:
+                break
+            if self.buf[length - 1] != FRAME_TAIL:
+                garbage.append(self.buf.pop(0))
+                continue
+            if garbage:
+                out.append((REC_GARBAGE, bytes(garbage)))
+                garbage = bytearray()
+            out.append((REC_FRAME, bytes(self.buf[:length])))
+            del self.buf[:length]
+        if garbage:
+            out.append((REC_GARBAGE, bytes(garbage)))
+        return out
+
+
+def frame_info(frame):
+    """(AFN, 校验是否正确)"""
+    checksum = sum(frame[3:-2]) % 256
+    return frame[4], checksum == frame[-2]
+
+
+class TraceWriter:
+    def __init__(self, path, port='', baudrate=0):
+        self.f = open(path, 'wb')
+        name = port.encode('utf-8')
+        self.f.write(FILE_HEADER.pack(MAGIC, VERSION, len(name), time.time_ns(), baudrate or 0))
+        self.f.write(name)
+        self.last_ns = time.monotonic_ns()
+        self.scanners = {DIR_TX: FrameScanner(), DIR_RX: FrameScanner()}
+
+    def record(self, kind, start_ns, end_ns, arg=0, data=b''):
+        delta_us = max(start_ns - self.last_ns, 0) // 1000
+        self.last_ns = start_ns
+        rec = bytearray([kind])
+        rec += _varint(delta_us)
+        rec += _varint(max(end_ns - start_ns, 0) // 1000)
+        rec += _varint(arg)
+        rec += _varint(len(data))
+        rec += data
+        self.f.write(rec)
+
+    def traffic(self, kind, start_ns, end_ns, direction, data, arg=0):
+        """记录一次收发，并追加切分出的帧边界"""
+        self.record(kind, start_ns, end_ns, arg, data)
+        for part_kind, part in self.scanners[direction].feed(data):
+            if part_kind == REC_FRAME:
+                afn, ok = frame_info(part)
+                self.record(REC_FRAME, end_ns, end_ns, direction, bytes(_varint(len(part)) + bytes([afn, ok])))
+            else:
+                self.record(REC_GARBAGE, end_ns, end_ns, direction, part)
+
+    def close(self):
+        if not self.f.closed:
+            now = time.monotonic_ns()
+            for direction, scanner in self.scanners.items():
+                if scanner.buf:
+                    self.record(REC_PARTIAL, now, now, direction, bytes(scanner.buf))
+            self.record(REC_CLOSE, now, now)
+            self.f.close()
+
+
+def load_trace(path):
+    """返回 (文件头字典, 记录列表)，记录为 (类型, 开始微秒, 耗时微秒, 参数, 数据)，开始时间相对于记录开始"""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    if len(buf) < FILE_HEADER.size:
+        raise ValueError("不是串口记录文件")
+    magic, version, name_len, start_ns, baudrate = FILE_HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("不是串口记录文件或版本不支持")
+    pos = FILE_HEADER.size
+    header = {
+        'port': buf[pos:pos + name_len].decode('utf-8', errors='replace'),
+        'baudrate': baudrate,
+        'start_ns': start_ns,
+    }
+    pos += name_len
+
+    records = []
+    t_us = 0
+    while pos < len(buf):
+        kind = buf[pos]
+        delta, pos = _read_varint(buf, pos + 1)
+        duration, pos = _read_varint(buf, pos)
+        arg, pos = _read_varint(buf, pos)
+        length, pos = _read_varint(buf, pos)
+        if pos + length > len(buf):
+            break  # 最后一条记录没写完（进程被杀），丢弃
+        t_us += delta
+        records.append((kind, t_us, duration, arg, bytes(buf[pos:pos + length])))
+        pos += length
+    return header, records
+
+
+class RecordingSerial:
+    """包装串口对象，记录所有收发；其余属性和方法原样转发"""
+
+    def __init__(self, ser, path):
+        self._ser = ser
+        self._trace = TraceWriter(path, getattr(ser, 'port', '') or '', getattr(ser, 'baudrate', 0))
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+    def write(self, data):
+        start = time.monotonic_ns()
+        result = self._ser.write(data)
+        self._trace.traffic(REC_WRITE, start, time.monotonic_ns(), DIR_TX, bytes(data))
+        return result
+
+    def read(self, size=1):
+        start = time.monotonic_ns()
+        data = self._ser.read(size)
+        self._trace.traffic(REC_READ, start, time.monotonic_ns(), DIR_RX, bytes(data), arg=size)
+        return data
+
+    def reset_input_buffer(self):
+        start = time.monotonic_ns()
+        self._ser.reset_input_buffer()
+        self._trace.record(REC_RESET, start, time.monotonic_ns())
+
+    def close(self):
+        self._trace.close()
+        self._ser.close()
+
+
+class ReplaySerial:
+    """用记录文件充当串口：写入与记录比对，读取按记录的耗时返回记录的数据
+
+    speed 为时间缩放，1 为原始时序，10 为加速 10 倍，0 为不等待。
+    写入的数据与记录不一致时记入 mismatches，回放照常进行。
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.header, records = load_trace(path)
+        self.port = self.header['port']
+        self.baudrate = self.header['baudrate']
+        self.timeout = None
+        self.is_open = True
+        self.speed = speed
+        self.writes = [r for r in records if r[0] == REC_WRITE]
+        self.reads = [r for r in records if r[0] == REC_READ]
+        self.mismatches = []
+        self._write_index = 0
+        self._read_index = 0
+
+    def _wait(self, duration_us):
+        if self.speed > 0 and duration_us:
+            time.sleep(duration_us / 1e6 / self.speed)
+
+    @property
+    def in_waiting(self):
+        if self._read_index < len(self.reads):
+            return len(self.reads[self._read_index][4])
+        return 0
+
+    def write(self, data):
+        data = bytes(data)
+        if self._write_index < len(self.writes):
+            _, _, duration, _, expected = self.writes[self._write_index]
+            if data != expected:
+                self.mismatches.append((self._write_index, expected, data))
+            self._wait(duration)
+        else:
+            self.mismatches.append((self._write_index, b'', data))
+        self._write_index += 1
+        return len(data)
+
+    def read(self, size=1):
+        if self._read_index >= len(self.reads):
+            return b''
+        _, _, duration, _, data = self.reads[self._read_index]
+        self._read_index += 1
+        self._wait(duration)
+        return data
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def dump(path, out=sys.stdout):
+    """按时间顺序打印记录，最后汇总每个功能码从发出指令到收到回复帧的延迟"""
+    header, records = load_trace(path)
+    start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['start_ns'] / 1e9))
+    print(f"串口 {header['port'] or '未知'}  波特率 {header['baudrate']}  开始于 {start}", file=out)
+
+    pending = {}      # AFN -> 指令帧发完的时刻
+    latencies = {}    # AFN -> [毫秒]
+    last_tx_afn = None
+    counts = {}
+    for kind, t_us, duration, arg, data in records:
+        counts[kind] = counts.get(kind, 0) + 1
+        stamp = f"{t_us / 1000:10.3f}ms"
+        if kind == REC_WRITE:
+            print(f"{stamp}  写 {len(data):4d}B  {duration / 1000:7.3f}ms  {data.hex(' ')}", file=out)
+        elif kind == REC_READ:
+            note = '超时' if not data else ('不足' if len(data) < arg else '')
+            print(f"{stamp}  读 {len(data):4d}B  {duration / 1000:7.3f}ms  (请求 {arg}) {note} {data.hex(' ')}",
+                  file=out)
+        elif kind == REC_FRAME:
+            length, pos = _read_varint(data, 0)
+            afn, ok = data[pos], data[pos + 1]
+            print(f"{'':12}  帧 {DIR_NAMES.get(arg, '?')} AFN={afn:02X}H 长度 {length} "
+                  f"{'校验正确' if ok else '校验错误'}", file=out)
+            if arg == DIR_TX:
+                pending[afn] = t_us
+                last_tx_afn = afn
+            elif last_tx_afn is not None and last_tx_afn in pending:
+                # 回复帧的功能码不一定与指令相同（如学习成功上报 22H），按最近一条指令统计
+                latencies.setdefault(last_tx_afn, []).append((t_us - pending.pop(last_tx_afn)) / 1000)
+        elif kind in (REC_GARBAGE, REC_PARTIAL):
+            print(f"{'':12}  {REC_NAMES[kind]} {DIR_NAMES.get(arg, '?')} {len(data)}B  {data.hex(' ')}", file=out)
+        else:
+            print(f"{stamp}  {REC_NAMES.get(kind, f'类型{kind}')}", file=out)
+
+    print("\n汇总:", file=out)
+    for kind in sorted(counts):
+        print(f"  {REC_NAMES.get(kind, kind)}: {counts[kind]}", file=out)
+    for afn in sorted(latencies):
+        values = sorted(latencies[afn])
+        print(f"  AFN={afn:02X}H 回复延迟: {len(values)} 次, 中位 {values[len(values) // 2]:.3f}ms, "
+              f"最大 {values[-1]:.3f}ms", file=out)
+    if pending:
+        print(f"  未收到回复帧的指令: {', '.join(f'{afn:02X}H' for afn in sorted(pending))}", file=out)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'dump' or not os.path.exists(sys.argv[2]):
+        print(f"用法: python3 {os.path.basename(sys.argv[0])} dump 记录文件")
+        sys.exit(1)
+    dump(sys.argv[2])
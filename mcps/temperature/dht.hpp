@@ -0,0 +1,151 @@
+#pragma once
+// DHT 单总线协议的边沿时间戳解码
+//
+// 读取分两步：引脚后端发出起始信号并捕获总线上的所有边沿（带时间戳），
+// 捕获结束后再统一按高电平宽度判定每一位。解码过程不接触硬件，
+// 可以配合 SimulatedBackend 在开发机上运行。
+
+#include <cstdint>
+#include <random>
+#include <string>
+#include <vector>
+
+enum class SensorType { DHT11 = 11, DHT22 = 22 };
+
+// 主机起始信号的低电平时长：DHT11 至少 18ms，DHT22 只需 1ms 以上
+static inline int startLowMs(SensorType type) {
+    return type == SensorType::DHT22 ? 2 : 20;
+}
+
+// 两次采样之间的最小间隔：DHT11 为 1 秒，DHT22/AM2302 为 2 秒，间隔不够时传感器不响应或返回旧数据
+static inline int minSampleIntervalMs(SensorType type) {
+    return type == SensorType::DHT22 ? 2000 : 1000;
+}
+
+struct Edge {
+    uint64_t tNs;   // 边沿时间戳，纳秒（单调时钟）
+    int level;      // 边沿之后的电平，0 或 1
+};
+
+// 引脚后端：负责起始信号和边沿捕获，解码与后端无关
+class PinBackend {
+public:
+    virtual ~PinBackend() = default;
+    // 发出起始信号并捕获一帧的边沿，失败时返回 false 并填写 err
+    virtual bool capture(std::vector<Edge>& edges, std::string& err) = 0;
+};
+
+// 由边沿序列解出 5 字节原始数据
+// 只取最后 40 个完整高电平脉冲作为数据位，前面的应答脉冲即使没捕获到也不影响解码
+static bool decodeDHTEdges(const std::vector<Edge>& edges, int highUS, uint8_t data[5], std::string& err) {
+    std::vector<int> highs;
+    highs.reserve(48);
+    for (size_t i = 1; i < edges.size(); ++i) {
+        if (edges[i - 1].level == 1 && edges[i].level == 0) {
+            highs.push_back((int)((edges[i].tNs - edges[i - 1].tNs) / 1000));
+        }
+    }
+    if (highs.size() < 40) {
+        err = "边沿数量不足: 仅捕获到 " + std::to_string(highs.size()) + " 个高电平脉冲";
+        return false;
+    }
+
+    for (int i = 0; i < 5; ++i) data[i] = 0;
+    size_t first = highs.size() - 40;
+    for (int i = 0; i < 40; ++i) {
+        int us = highs[first + i];
+        if (us > 100) {
+            err = "第 " + std::to_string(i) + " 位高电平过长: " + std::to_string(us) + "us";
+            return false;
+        }
+        data[i / 8] = (uint8_t)((data[i / 8] << 1) | (us > highUS ? 1 : 0));
+    }
+
+    uint8_t sum = (uint8_t)(data[0] + data[1] + data[2] + data[3]);
+    if (sum != data[4]) {
+        err = "校验失败: 计算 " + std::to_string(sum) + " != 接收 " + std::to_string(data[4]);
+        return false;
+    }
+    return true;
+}
+
+// 把 5 字节原始数据换算为 0.1 单位的湿度和温度，并做范围检查
+static bool convertDHT(SensorType type, const uint8_t data[5], int& humidityX10, int& temperatureX10, std::string& err) {
+    if (type == SensorType::DHT22) {
+        humidityX10    = (data[0] << 8) | data[1];
+        temperatureX10 = ((data[2] & 0x7F) << 8) | data[3];
+        if (data[2] & 0x80) temperatureX10 = -temperatureX10;
+        if (humidityX10 > 1000 || temperatureX10 < -400 || temperatureX10 > 800) {
+            err = "数据异常: 湿度 " + std::to_string(humidityX10) + " x0.1%, 温度 " + std::to_string(temperatureX10) + " x0.1°C";
+            return false;
+        }
+        return true;
+    }
+
+    if (data[0] > 100 || data[2] > 80) {
+        err = "数据异常: 湿度 " + std::to_string(data[0]) + "%, 温度 " + std::to_string(data[2]) + "°C";
+        return false;
+    }
+    humidityX10    = data[0] * 10;
+    temperatureX10 = data[2] * 10;
+    return true;
+}
+
+// 软件模拟的 DHT 传感器，按协议时序生成边沿，用于离线调试解码和退避逻辑
+class SimulatedBackend : public PinBackend {
+public:
+    SimulatedBackend(SensorType type, int humidityX10, int temperatureX10, int jitterUs = 4, int failEvery = 0)
+        : type_(type), humidity_(humidityX10), temperature_(temperatureX10), jitterUs_(jitterUs),
+          failEvery_(failEvery), rng_(12345) {}
+
+    bool capture(std::vector<Edge>& edges, std::string& err) override {
+        edges.clear();
+        ++count_;
+        if (failEvery_ > 0 && count_ % failEvery_ == 0) {
+            err = "模拟传感器无响应";
+            return false;
+        }
+
+        uint8_t data[5] = {0};
+        if (type_ == SensorType::DHT22) {
+            int absT = temperature_ < 0 ? -temperature_ : temperature_;
+            data[0] = (uint8_t)(humidity_ >> 8);
+            data[1] = (uint8_t)humidity_;
+            data[2] = (uint8_t)((absT >> 8) | (temperature_ < 0 ? 0x80 : 0));
+            data[3] = (uint8_t)absT;
+        } else {
+            data[0] = (uint8_t)(humidity_ / 10);
+            data[2] = (uint8_t)(temperature_ / 10);
+        }
+        data[4] = (uint8_t)(data[0] + data[1] + data[2] + data[3]);
+
+        uint64_t t = 0;
+        auto edge = [&](int level, int us) {
+            t += (uint64_t)jittered(us) * 1000;
+            edges.push_back({t, level});
+        };
+        // 主机释放总线后：等待 -> 应答低 80us -> 应答高 80us
+        edge(0, 30);
+        edge(1, 80);
+        edge(0, 80);
+        for (int i = 0; i < 40; ++i) {
+            bool bit = (data[i / 8] >> (7 - i % 8)) & 1;
+            edge(1, 50);
+            edge(0, bit ? 70 : 27);
+        }
+        edge(1, 50);
+        return true;
+    }
+
+private:
+    int jittered(int us) {
+        if (jitterUs_ <= 0) return us;
+        std::uniform_int_distribution<int> d(-jitterUs_, jitterUs_);
+        return us + d(rng_);
+    }
+
+    SensorType type_;
+    int humidity_, temperature_, jitterUs_, failEvery_;
+    int count_ = 0;
+    std::mt19937 rng_;
+};
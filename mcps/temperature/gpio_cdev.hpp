@@ -0,0 +1,151 @@
+#pragma once
+// 基于 GPIO 字符设备 (v2 uAPI) 的引脚后端
+//
+// 起始信号用输出请求拉低总线，随后在同一请求上重新配置为带双边沿检测的输入，
+// 边沿时间戳由内核在中断中记录，用户态只需在一帧结束后批量读出事件，
+// 不再需要实时优先级和忙等轮询。
+
+#include "dht.hpp"
+
+#include <linux/gpio.h>
+#include <sys/ioctl.h>
+#include <poll.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <dirent.h>
+#include <cerrno>
+#include <cstring>
+#include <fstream>
+#include <thread>
+#include <chrono>
+
+class GpioCdevBackend : public PinBackend {
+public:
+    GpioCdevBackend(const std::string& chipPath, unsigned offset, int startLowMs = 20)
+        : chipPath_(chipPath), offset_(offset), startLowMs_(startLowMs) {}
+
+    ~GpioCdevBackend() override {
+        if (chipFd_ != -1) close(chipFd_);
+    }
+
+    bool capture(std::vector<Edge>& edges, std::string& err) override {
+        edges.clear();
+        if (chipFd_ == -1) {
+            chipFd_ = open(chipPath_.c_str(), O_RDWR | O_CLOEXEC);
+            if (chipFd_ == -1) {
+                err = "无法打开 " + chipPath_ + ": " + std::strerror(errno);
+                return false;
+            }
+        }
+
+        // 输出低电平作为起始信号
+        struct gpio_v2_line_request req;
+        std::memset(&req, 0, sizeof(req));
+        req.offsets[0] = offset_;
+        req.num_lines = 1;
+        req.event_buffer_size = 256;
+        std::strncpy(req.consumer, "temperature", sizeof(req.consumer) - 1);
+        req.config.flags = GPIO_V2_LINE_FLAG_OUTPUT;
+        req.config.num_attrs = 1;
+        req.config.attrs[0].attr.id = GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES;
+        req.config.attrs[0].attr.values = 0;
+        req.config.attrs[0].mask = 1;
+        if (ioctl(chipFd_, GPIO_V2_GET_LINE_IOCTL, &req) == -1) {
+            err = "请求 GPIO 线失败: " + std::string(std::strerror(errno));
+            return false;
+        }
+        int lineFd = req.fd;
+
+        std::this_thread::sleep_for(std::chrono::milliseconds(startLowMs_));
+
+        // 释放总线并切换为双边沿检测输入，由上拉电阻拉高
+        struct gpio_v2_line_config cfg;
+        std::memset(&cfg, 0, sizeof(cfg));
+        cfg.flags = GPIO_V2_LINE_FLAG_INPUT | GPIO_V2_LINE_FLAG_EDGE_RISING |
+                    GPIO_V2_LINE_FLAG_EDGE_FALLING | GPIO_V2_LINE_FLAG_BIAS_PULL_UP;
+        if (ioctl(lineFd, GPIO_V2_LINE_SET_CONFIG_IOCTL, &cfg) == -1) {
+            err = "切换为边沿检测失败: " + std::string(std::strerror(errno));
+            close(lineFd);
+            return false;
+        }
+
+        // 一帧约 5ms；收到首个边沿后静默 2ms 即认为结束，总时长不超过 30ms
+        struct gpio_v2_line_event events[64];
+        auto deadline = std::chrono::steady_clock::now() + std::chrono::milliseconds(30);
+        while (true) {
+            int waitMs = edges.empty() ? (int)std::chrono::duration_cast<std::chrono::milliseconds>(
+                             deadline - std::chrono::steady_clock::now()).count() : 2;
+            if (waitMs <= 0) break;
+            struct pollfd pfd = {lineFd, POLLIN, 0};
+            if (poll(&pfd, 1, waitMs) <= 0) break;
+            ssize_t n = read(lineFd, events, sizeof(events));
+            if (n <= 0) break;
+            for (size_t i = 0; i < (size_t)n / sizeof(events[0]); ++i) {
+                int level = events[i].id == GPIO_V2_LINE_EVENT_RISING_EDGE ? 1 : 0;
+                edges.push_back({events[i].timestamp_ns, level});
+            }
+            if (std::chrono::steady_clock::now() > deadline) break;
+        }
+        close(lineFd);
+
+        if (edges.empty()) {
+            err = "传感器无响应";
+            return false;
+        }
+        return true;
+    }
+
+private:
+    std::string chipPath_;
+    unsigned offset_;
+    int startLowMs_;
+    int chipFd_ = -1;
+};
+
+static bool readSysfsText(const std::string& path, std::string& out) {
+    std::ifstream f(path);
+    if (!f.is_open()) return false;
+    std::getline(f, out);
+    return true;
+}
+
+// 把全局 GPIO 编号（wiringPi 的 wpiPinToGpio 结果）换算为字符设备路径和线偏移
+// sysfs 中 gpiochip<base> 的命名与 /dev/gpiochipN 不对应，因此按 label 匹配
+static bool resolveGpioLine(int gpio, std::string& chipPath, unsigned& offset) {
+    std::string label;
+    int base = -1;
+    DIR* dir = opendir("/sys/class/gpio");
+    if (!dir) return false;
+    while (struct dirent* ent = readdir(dir)) {
+        std::string name = ent->d_name;
+        if (name.rfind("gpiochip", 0) != 0) continue;
+        std::string root = "/sys/class/gpio/" + name + "/";
+        std::string sBase, sNgpio, sLabel;
+        if (!readSysfsText(root + "base", sBase) || !readSysfsText(root + "ngpio", sNgpio) ||
+            !readSysfsText(root + "label", sLabel)) continue;
+        int b = std::atoi(sBase.c_str()), n = std::atoi(sNgpio.c_str());
+        if (gpio >= b && gpio < b + n) {
+            base = b;
+            label = sLabel;
+            break;
+        }
+    }
+    closedir(dir);
+    if (base < 0) return false;
+
+    for (int i = 0; i < 16; ++i) {
+        std::string path = "/dev/gpiochip" + std::to_string(i);
+        int fd = open(path.c_str(), O_RDONLY | O_CLOEXEC);
+        if (fd == -1) continue;
+        struct gpiochip_info info;
+        std::memset(&info, 0, sizeof(info));
+        bool match = ioctl(fd, GPIO_GET_CHIPINFO_IOCTL, &info) == 0 && label == info.label;
+        close(fd);
+        if (match) {
+            chipPath = path;
+            offset = (unsigned)(gpio - base);
+            return true;
+        }
+    }
+    return false;
+}
@@ -4,161 +4,432 @@
 #include <chrono>
 #include <cstdint>
 #include <cstdlib>
-#include <sched.h>
+#include <memory>
+#include <algorithm>
 #include <fstream>
 #include <string>
 #include <ctime>
+#include <cstring>
+#include <sstream>
+#include <vector>
+#include <cstdio>
+#include <atomic>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
-static int waitLevelMicro(int pin, int level, int timeoutUs) {
-    // 轮询等待达到相反电平，返回持续时间(微秒)，超时返回 -1
-    int count = 0;
-    while (digitalRead(pin) == level) {
-        if (++count > timeoutUs) return -1;
-        delayMicroseconds(1);
+#include "dht.hpp"
+#include "gpio_cdev.hpp"
+
+// 共享内存中各传感器的最新读数，使用顺序锁(seqlock)发布：
+// 写入前 seq 置为奇数，写完后置为偶数；读者在 seq 为偶数且前后一致时才采用数据。
+// 一次发布覆盖全部传感器，读者一次即可拿到所有房间的一致快照。
+// 布局需与 temperature_tool.py 中的 SHM_HEADER / SHM_SLOT 保持一致（小端）。
+static const uint32_t SHM_MAGIC   = 0x4D534854;  // "THSM"
+static const uint32_t SHM_VERSION = 2;
+static const int MAX_SENSORS      = 16;
+static const int SENSOR_NAME_SIZE = 32;
+
+enum SlotStatus : uint32_t { SLOT_NO_DATA = 0, SLOT_OK = 1, SLOT_FAILING = 2 };
+
+struct SharedHeader {
+    uint32_t magic;
+    uint32_t version;
+    std::atomic<uint32_t> seq;
+    uint32_t count;
+    int64_t  updated;
+    uint32_t reserved[2];
+};
+
+struct SharedSlot {
+    char     name[SENSOR_NAME_SIZE];
+    int64_t  timestamp;
+    int32_t  humidityX10;     // 0.1%
+    int32_t  temperatureX10;  // 0.1°C
+    uint32_t type;            // 11 或 22
+    uint32_t status;          // SlotStatus
+    uint32_t failures;        // 连续失败次数
+    uint32_t reserved;
+};
+
+struct SharedReadings {
+    SharedHeader header;
+    SharedSlot   slots[MAX_SENSORS];
+};
+static_assert(sizeof(SharedHeader) == 32 && sizeof(SharedSlot) == 64,
+              "共享内存布局变化需同步修改 Python 端");
+static_assert(std::atomic<uint32_t>::is_always_lock_free, "seq 必须是无锁原子量");
+
+static SharedReadings* openSharedReadings(const std::string& name) {
+    int fd = shm_open(name.c_str(), O_CREAT | O_RDWR, 0644);
+    if (fd == -1) return nullptr;
+    fchmod(fd, 0644);  // 不受 umask 影响，保证普通用户可读
+    if (ftruncate(fd, sizeof(SharedReadings)) == -1) {
+        close(fd);
+        return nullptr;
+    }
+    void* p = mmap(nullptr, sizeof(SharedReadings), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (p == MAP_FAILED) return nullptr;
+
+    SharedReadings* shm = static_cast<SharedReadings*>(p);
+    // 段在服务重启之间保留；若上次在写入中途退出，seq 会停在奇数，这里把它补成偶数
+    uint32_t seq = shm->header.seq.load(std::memory_order_relaxed);
+    if (seq & 1) shm->header.seq.store(seq + 1, std::memory_order_release);
+    return shm;
+}
+
+struct Sensor {
+    std::string name;
+    std::string pinSpec;
+    SensorType  type = SensorType::DHT11;
+    int intervalS = 30;
+    int highUS    = 45;
+    std::unique_ptr<PinBackend> backend;
+
+    std::chrono::steady_clock::time_point due;        // 下一次读取时间
+    std::chrono::steady_clock::time_point cycleStart; // 本轮采样的计划时间
+    int attempt  = 0;   // 本轮已失败次数，用于退避
+    int failures = 0;   // 连续失败次数，对外发布
+
+    SlotStatus status = SLOT_NO_DATA;
+    int64_t timestamp = 0;
+    int humidityX10 = 0;
+    int temperatureX10 = 0;
+};
+
+static void publishSharedReadings(SharedReadings* shm, const std::vector<Sensor>& sensors, int64_t updated) {
+    uint32_t seq = shm->header.seq.load(std::memory_order_relaxed);
+    shm->header.seq.store(seq + 1, std::memory_order_relaxed);
+    std::atomic_thread_fence(std::memory_order_release);
+
+    shm->header.magic   = SHM_MAGIC;
+    shm->header.version = SHM_VERSION;
+    shm->header.count   = (uint32_t)sensors.size();
+    shm->header.updated = updated;
+    for (size_t i = 0; i < sensors.size(); ++i) {
+        const Sensor& s = sensors[i];
+        SharedSlot& slot = shm->slots[i];
+        std::memset(slot.name, 0, sizeof(slot.name));
+        std::memcpy(slot.name, s.name.data(), s.name.size());
+        slot.timestamp      = s.timestamp;
+        slot.humidityX10    = s.humidityX10;
+        slot.temperatureX10 = s.temperatureX10;
+        slot.type           = (uint32_t)s.type;
+        slot.status         = s.status;
+        slot.failures       = (uint32_t)s.failures;
+    }
+
+    shm->header.seq.store(seq + 2, std::memory_order_release);
+}
+
+// 先写临时文件再 rename，读者要么看到旧文件要么看到完整的新文件
+static bool writeFileAtomic(const std::string& path, const std::string& content) {
+    std::string tmp = path + ".tmp";
+    {
+        std::ofstream file(tmp, std::ios::out | std::ios::trunc);
+        if (!file.is_open()) return false;
+        file << content;
+        file.flush();
+        if (!file) return false;
     }
-    return count;
+    return std::rename(tmp.c_str(), path.c_str()) == 0;
 }
 
-static int waitForLevel(int pin, int level, int timeoutUs) {
-    unsigned int start = micros();
-    while (digitalRead(pin) != level) {
-        if ((int)(micros() - start) > timeoutUs) return -1;
+// 捕获一帧边沿后再解码，传感器应答和位判定都不再依赖忙等
+static bool readSensor(Sensor& sensor, int &humidityX10, int &temperatureX10) {
+    std::vector<Edge> edges;
+    std::string err;
+    uint8_t data[5];
+
+    if (!sensor.backend->capture(edges, err) ||
+        !decodeDHTEdges(edges, sensor.highUS, data, err) ||
+        !convertDHT(sensor.type, data, humidityX10, temperatureX10, err)) {
+        std::cerr << "[" << sensor.name << "] " << err << "\n";
+        return false;
     }
-    return (int)(micros() - start);
+    return true;
 }
 
-// 测量高电平持续时间
-static int measureHighFromCurrent(int pin, int timeoutUs) {
-    unsigned int start = micros();
-    if (waitForLevel(pin, LOW, timeoutUs) == -1) return -1;
-    return (int)(micros() - start);
+// 失败后按指数退避重试，次数有上限；全部失败则放弃本轮，等下一个采样周期
+static const int RETRY_MAX_ATTEMPTS = 5;
+static const int RETRY_BASE_MS      = 1000;  // 实际取它和传感器最小采样间隔的较大值，见 minSampleIntervalMs
+static const int RETRY_MAX_MS       = 8000;
+
+// 相邻两次捕获（不论是否同一传感器）之间的最小间隔，避免时序敏感的捕获挤在一起
+static const int CAPTURE_GAP_MS = 200;
+
+// 引脚参数：wPi 引脚号、chip:offset（如 gpiochip1:5）或 sim（软件模拟传感器）
+static std::unique_ptr<PinBackend> makeBackend(const std::string& pinSpec, SensorType type) {
+    if (pinSpec == "sim") {
+        return std::unique_ptr<PinBackend>(new SimulatedBackend(type, 550, 235));
+    }
+
+    std::string chipPath;
+    unsigned offset = 0;
+    size_t colon = pinSpec.find(':');
+    if (colon != std::string::npos) {
+        chipPath = pinSpec.substr(0, colon);
+        if (chipPath[0] != '/') chipPath = "/dev/" + chipPath;
+        offset = (unsigned)std::atoi(pinSpec.c_str() + colon + 1);
+    } else {
+        int wpiPin = std::atoi(pinSpec.c_str());
+        if (wpiPin < 0 || wpiPin > 64) {
+            std::cerr << "无效的 wPi 引脚号: " << wpiPin << "\n";
+            return nullptr;
+        }
+        static bool wiringPiReady = false;
+        if (!wiringPiReady && wiringPiSetup() == -1) {
+            std::cerr << "wiringPi 初始化失败\n";
+            return nullptr;
+        }
+        wiringPiReady = true;
+        int gpio = wpiPinToGpio(wpiPin);
+        if (gpio < 0 || !resolveGpioLine(gpio, chipPath, offset)) {
+            std::cerr << "无法将 wPi 引脚 " << wpiPin << " 映射到 GPIO 字符设备\n";
+            return nullptr;
+        }
+    }
+    std::cout << "使用 GPIO " << chipPath << " 线 " << offset << std::endl;
+    return std::unique_ptr<PinBackend>(new GpioCdevBackend(chipPath, offset, startLowMs(type)));
 }
 
-static bool readDHT11(int pin, int highUS, int &humidity, int &temperature) {
-    uint8_t data[5] = {0};
-
-    pinMode(pin, OUTPUT);
-    digitalWrite(pin, HIGH);
-    delay(50);
-    digitalWrite(pin, LOW);
-    delay(20);
-    digitalWrite(pin, HIGH);
-    delayMicroseconds(30);
-    pinMode(pin, INPUT);
-    delayMicroseconds(5);
-
-    if (waitForLevel(pin, LOW, 2000)  == -1||
-        waitForLevel(pin, HIGH, 2000) == -1||
-        waitForLevel(pin, LOW, 2000)  == -1) {
-        std::cerr << "传感器无响应\n";
+// 配置文件每行一个传感器：名称 引脚 类型 [间隔秒数] [高电平阈值us]，# 开头为注释
+static bool loadConfig(const std::string& path, std::vector<Sensor>& sensors) {
+    std::ifstream file(path);
+    if (!file.is_open()) {
+        std::cerr << "无法打开配置文件: " << path << "\n";
         return false;
     }
 
-    for (int i = 0; i < 40; ++i) {
-        if (waitForLevel(pin, HIGH, 1000) == -1) {
-            std::cerr << "等待高电平超时\n";
+    std::string line;
+    int lineNo = 0;
+    while (std::getline(file, line)) {
+        ++lineNo;
+        size_t hash = line.find('#');
+        if (hash != std::string::npos) line.erase(hash);
+        std::istringstream in(line);
+        Sensor sensor;
+        std::string type;
+        if (!(in >> sensor.name)) continue;
+        if (!(in >> sensor.pinSpec >> type)) {
+            std::cerr << path << ":" << lineNo << ": 至少需要 名称 引脚 类型\n";
             return false;
         }
+        in >> sensor.intervalS >> sensor.highUS;
 
-        int highUs = measureHighFromCurrent(pin, 2000);
-        if (highUs == -1){
-            std::cerr << "等待高电平超时\n";
+        std::transform(type.begin(), type.end(), type.begin(), ::toupper);
+        if (type == "DHT11") {
+            sensor.type = SensorType::DHT11;
+        } else if (type == "DHT22" || type == "AM2302") {
+            sensor.type = SensorType::DHT22;
+        } else {
+            std::cerr << path << ":" << lineNo << ": 不支持的传感器类型 " << type << "\n";
             return false;
         }
-
-        data[i / 8] <<= 1;
-        data[i / 8] |= (highUs > highUS) ? 1 : 0;
-
-        if (waitForLevel(pin, LOW, 1000) == -1) {
-            std::cerr << "等待低电平超时\n";
+        if (sensor.name.size() >= (size_t)SENSOR_NAME_SIZE) {
+            std::cerr << path << ":" << lineNo << ": 名称过长（最多 " << SENSOR_NAME_SIZE - 1 << " 字节）\n";
             return false;
         }
+        // 读取端（temperature_tool、规则引擎）按名称查找传感器，重名会被合并或遮住
+        for (const Sensor& other : sensors) {
+            if (other.name == sensor.name) {
+                std::cerr << path << ":" << lineNo << ": 传感器名称 " << sensor.name << " 重复\n";
+                return false;
+            }
+        }
+        if (sensor.intervalS < 2) sensor.intervalS = 2;
+        sensors.push_back(std::move(sensor));
     }
 
-    uint8_t sum = (uint8_t)(data[0] + data[1] + data[2] + data[3]);
-    if (sum != data[4]) {
-        std::cerr << "校验失败: 计算 " << (int)sum << " != 接收 " << (int)data[4] << "\n";
+    if (sensors.empty() || sensors.size() > (size_t)MAX_SENSORS) {
+        std::cerr << "配置文件中的传感器数量应为 1-" << MAX_SENSORS << "\n";
         return false;
     }
+    return true;
+}
 
-    if(data[0]>100||data[2]>80){
-        std::cerr << "数据异常: 湿度 " << (int)data[0] << "%, 温度 " << (int)data[2] << "°C\n";
-        return false;
+// 0.1 单位的整数转成 JSON 数字，整数值不带小数部分（DHT11 输出与旧版一致）
+static std::string formatTenths(int v) {
+    if (v % 10 == 0) return std::to_string(v / 10);
+    std::string sign = v < 0 ? "-" : "";
+    int a = v < 0 ? -v : v;
+    return sign + std::to_string(a / 10) + "." + std::to_string(a % 10);
+}
+
+// 名称来自配置文件，写入 JSON 前转义引号、反斜杠和控制字符
+static std::string jsonEscape(const std::string& s) {
+    std::string out;
+    for (unsigned char c : s) {
+        if (c == '"' || c == '\\') {
+            out += '\\';
+            out += (char)c;
+        } else if (c < 0x20) {
+            char buf[8];
+            std::snprintf(buf, sizeof(buf), "\\u%04x", c);
+            out += buf;
+        } else {
+            out += (char)c;
+        }
     }
-    humidity    = data[0];
-    temperature = data[2];
-    return true;
+    return out;
+}
+
+static const char* statusName(SlotStatus status) {
+    switch (status) {
+        case SLOT_OK:      return "ok";
+        case SLOT_FAILING: return "failing";
+        default:           return "no_data";
+    }
+}
+
+// 兼容输出：顶层字段取第一个有数据的传感器，sensors 数组包含全部传感器
+static std::string buildJson(const std::vector<Sensor>& sensors) {
+    const Sensor* primary = nullptr;
+    for (const Sensor& s : sensors) {
+        if (s.status != SLOT_NO_DATA) { primary = &s; break; }
+    }
+
+    std::string json_data = "{";
+    if (primary) {
+        json_data += "\"timestamp\":" + std::to_string(primary->timestamp) + ",";
+        json_data += "\"humidity\":" + formatTenths(primary->humidityX10) + ",";
+        json_data += "\"temperature\":" + formatTenths(primary->temperatureX10) + ",";
+    }
+    json_data += "\"unit\":{\"humidity\":\"%\",\"temperature\":\"°C\"},";
+    json_data += "\"sensors\":[";
+    for (size_t i = 0; i < sensors.size(); ++i) {
+        const Sensor& s = sensors[i];
+        if (i) json_data += ",";
+        json_data += "{\"name\":\"" + jsonEscape(s.name) + "\",";
+        json_data += "\"type\":\"DHT" + std::to_string((int)s.type) + "\",";
+        json_data += "\"status\":\"" + std::string(statusName(s.status)) + "\"";
+        if (s.status != SLOT_NO_DATA) {
+            json_data += ",\"timestamp\":" + std::to_string(s.timestamp);
+            json_data += ",\"humidity\":" + formatTenths(s.humidityX10);
+            json_data += ",\"temperature\":" + formatTenths(s.temperatureX10);
+        }
+        json_data += "}";
+    }
+    json_data += "]}";
+    return json_data;
+}
+
+static void printUsage(const char* prog) {
+    std::cout<<"用法: "<<prog<<" [DHT_PIN] [OUTPUT_FILE] [HIGH_US] [SHM_NAME]\n";
+    std::cout<<"      "<<prog<<" --config CONFIG_FILE [OUTPUT_FILE] [SHM_NAME]\n";
+    std::cout<<"  DHT_PIN: 使用的wPi引脚号，默认3；也可写成 chip:offset (如 gpiochip1:5)，或 sim 使用模拟传感器\n";
+    std::cout<<"  OUTPUT_FILE: 输出数据文件路径，默认/tmp/temperature_humidity.json\n";
+    std::cout<<"  HIGH_US: 高电平阈值，单位微秒，默认45\n";
+    std::cout<<"  SHM_NAME: 共享内存名称，默认/temperature_humidity (即/dev/shm/temperature_humidity)\n";
+    std::cout<<"  CONFIG_FILE: 多传感器配置，每行: 名称 引脚 类型(DHT11/DHT22) [间隔秒数] [HIGH_US]\n";
 }
 
 int main(int argc, char** argv) {
     using namespace std::chrono;
 
     if (argc>1&&(argv[1]==std::string("--help")||argv[1]==std::string("-h"))){
-        std::cout<<"用法: "<<argv[0]<<" [DHT_PIN] [OUTPUT_FILE] [HIGH_US]\n";
-        std::cout<<"  DHT_PIN: 使用的wPi引脚号，默认3\n";
-        std::cout<<"  OUTPUT_FILE: 输出数据文件路径，默认/tmp/temperature_humidity.json\n";
-        std::cout<<"  HIGH_US: 高电平阈值，单位微秒，默认45\n";
+        printUsage(argv[0]);
         return 0;
     }
 
-    int DHT_PIN = 3;
-    if (argc > 1) DHT_PIN = std::atoi(argv[1]);
-
+    std::vector<Sensor> sensors;
     std::string output_file = "/tmp/temperature_humidity.json";
-    if (argc > 2) output_file = argv[2];
-    
-    int highUS = 45; // 高电平阈值，单位微秒
-    if (argc > 3) highUS = std::atoi(argv[3]);
+    std::string shm_name = "/temperature_humidity";
+
+    if (argc > 1 && argv[1] == std::string("--config")) {
+        if (argc < 3) {
+            printUsage(argv[0]);
+            return 1;
+        }
+        if (!loadConfig(argv[2], sensors)) return 1;
+        if (argc > 3) output_file = argv[3];
+        if (argc > 4) shm_name = argv[4];
+    } else {
+        // 单传感器的旧参数形式
+        Sensor sensor;
+        sensor.name = "default";
+        sensor.pinSpec = "3";
+        if (argc > 1) sensor.pinSpec = argv[1];
+        if (argc > 2) output_file = argv[2];
+        if (argc > 3) sensor.highUS = std::atoi(argv[3]);
+        if (argc > 4) shm_name = argv[4];
+        sensors.push_back(std::move(sensor));
+    }
 
-    if (wiringPiSetup() == -1) {
-        std::cerr << "wiringPi 初始化失败\n";
-        return 1;
+    for (Sensor& sensor : sensors) {
+        sensor.backend = makeBackend(sensor.pinSpec, sensor.type);
+        if (!sensor.backend) return 1;
     }
 
-    struct sched_param sp; sp.sched_priority = 10;
-    sched_setscheduler(0, SCHED_FIFO, &sp);
+    SharedReadings* shm = openSharedReadings(shm_name);
+    if (!shm) {
+        std::cerr << "无法创建共享内存 " << shm_name << "，仅输出数据文件\n";
+    }
 
-    if (DHT_PIN < 0 || DHT_PIN > 64) {
-        std::cerr << "无效的 wPi 引脚号: " << DHT_PIN << "\n";
-        return 1;
+    // 各传感器的首次读取在各自周期内均匀错开
+    auto start = steady_clock::now();
+    for (size_t i = 0; i < sensors.size(); ++i) {
+        Sensor& s = sensors[i];
+        s.due = start + milliseconds((int64_t)s.intervalS * 1000 * (int64_t)i / (int64_t)sensors.size());
+        s.cycleStart = s.due;
     }
 
-    std::cout << "温度湿度监控服务启动，数据文件: " << output_file << std::endl;
+    std::cout << "温度湿度监控服务启动，传感器 " << sensors.size() << " 个，数据文件: " << output_file << std::endl;
 
+    // 单线程调度：每次只做一次捕获，捕获之间至少间隔 CAPTURE_GAP_MS
+    auto lastCapture = start - milliseconds(CAPTURE_GAP_MS);
     while (true) {
+        Sensor* next = &sensors[0];
+        for (Sensor& s : sensors) {
+            if (s.due < next->due) next = &s;
+        }
+        auto when = std::max(next->due, lastCapture + milliseconds(CAPTURE_GAP_MS));
+        std::this_thread::sleep_until(when);
+
+        Sensor& sensor = *next;
         int h = 0, t = 0;
-        bool ok = false;
-        do{
-            ok = readDHT11(DHT_PIN, highUS, h, t);
-            std::cerr << (ok ? "读取成功\n" : "读取失败，重试...\n");
-            if (!ok) delay(120);
-        }while(!ok);
+        bool ok = readSensor(sensor, h, t);
+        lastCapture = steady_clock::now();
 
         if (ok) {
-            // 获取当前时间戳
-            auto now = std::chrono::system_clock::now();
-            auto timestamp = std::chrono::duration_cast<std::chrono::seconds>(
-                now.time_since_epoch()).count();
-
-            // 创建JSON格式数据
-            std::string json_data = "{";
-            json_data += "\"timestamp\":" + std::to_string(timestamp) + ",";
-            json_data += "\"humidity\":" + std::to_string(h) + ",";
-            json_data += "\"temperature\":" + std::to_string(t) + ",";
-            json_data += "\"unit\":{\"humidity\":\"%\",\"temperature\":\"°C\"}";
-            json_data += "}";
-
-            // 写入文件
-            std::ofstream file(output_file, std::ios::out | std::ios::trunc);
-            if (file.is_open()) {
-                file << json_data;
-                file.close();
-                std::cout << "数据已更新: 湿度 " << h << "%, 温度 " << t << "°C" << std::endl;
-            } else {
-                std::cerr << "无法写入数据文件: " << output_file << std::endl;
+            sensor.humidityX10 = h;
+            sensor.temperatureX10 = t;
+            sensor.timestamp = duration_cast<seconds>(system_clock::now().time_since_epoch()).count();
+            sensor.status = SLOT_OK;
+            sensor.attempt = 0;
+            sensor.failures = 0;
+            std::cout << "[" << sensor.name << "] 数据已更新: 湿度 " << formatTenths(h)
+                      << "%, 温度 " << formatTenths(t) << "°C" << std::endl;
+        } else {
+            ++sensor.failures;
+            ++sensor.attempt;
+            if (sensor.status == SLOT_OK) sensor.status = SLOT_FAILING;
+            if (sensor.attempt < RETRY_MAX_ATTEMPTS) {
+                int baseMs = std::max(RETRY_BASE_MS, minSampleIntervalMs(sensor.type));
+                int waitMs = std::min(baseMs << (sensor.attempt - 1), RETRY_MAX_MS);
+                std::cerr << "[" << sensor.name << "] 读取失败，" << waitMs << "ms 后重试 ("
+                          << sensor.attempt << "/" << RETRY_MAX_ATTEMPTS << ")\n";
+                sensor.due = lastCapture + milliseconds(waitMs);
+                continue;
             }
+            std::cerr << "[" << sensor.name << "] 连续 " << RETRY_MAX_ATTEMPTS << " 次读取失败，跳过本轮\n";
+            sensor.attempt = 0;
+        }
+
+        // 按计划周期推进，不因重试而漂移
+        sensor.cycleStart += seconds(sensor.intervalS);
+        if (sensor.cycleStart < lastCapture) sensor.cycleStart = lastCapture + seconds(sensor.intervalS);
+        sensor.due = sensor.cycleStart;
+
+        int64_t updated = duration_cast<seconds>(system_clock::now().time_since_epoch()).count();
+        if (shm) publishSharedReadings(shm, sensors, updated);
+
+        // 写入文件（兼容输出）
+        if (!writeFileAtomic(output_file, buildJson(sensors))) {
+            std::cerr << "无法写入数据文件: " << output_file << std::endl;
         }
-        std::this_thread::sleep_for(30s);  // 每30秒更新一次
     }
     return 0;
-}
\ No newline at end of file
+}
@@ -4,80 +4,498 @@
 """
 
 import asyncio
+import ctypes
 import json
+import mmap
+import operator
 import os
-from typing import Any, Dict
+import struct
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# 默认数据文件路径（兼容输出，由监控服务原子替换）
+DATA_FILE = "/var/lib/temperature_humidity.json"
+
+# 监控服务发布各传感器最新读数的共享内存段，布局见 main.cpp 中的 SharedReadings
+SHM_PATH = "/dev/shm/temperature_humidity"
+SHM_MAGIC = 0x4D534854
+SHM_VERSION = 2
+SHM_MAX_SENSORS = 16
+# magic, version, seq, count, updated
+SHM_HEADER = struct.Struct("<IIIIq8x")
+# name, timestamp, humidity_x10, temperature_x10, type, status, failures, reserved
+SHM_SLOT = struct.Struct("<32sqiiIIII")
+SHM_SIZE = SHM_HEADER.size + SHM_MAX_SENSORS * SHM_SLOT.size
+SHM_SEQ = struct.Struct("<I")
+SHM_SEQ_OFFSET = 8
+SHM_MAX_RETRIES = 100
+
+SLOT_STATUS = {0: "no_data", 1: "ok", 2: "failing"}
+
+UNIT = {"humidity": "%", "temperature": "°C"}
+
+
+def _from_tenths(value: int):
+    """0.1 单位的整数转为数值，整数值保持 int（与 DHT11 的旧输出一致）."""
+    return value // 10 if value % 10 == 0 else value / 10
+
+
+class SharedReadingReader:
+    """共享内存读数的只读映射.
+
+    按顺序锁协议读取：seq 为奇数表示正在写入，读取前后 seq 不一致表示读到了
+    一半的数据，两种情况都重试。读取直接在映射上解包，不经过文件系统调用。
+    """
+
+    def __init__(self, path: str = SHM_PATH):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), SHM_SIZE, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._map = None
+            return False
+        return True
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def seq(self) -> Optional[int]:
+        """当前发布序号，只读一个整数，可以高频调用；共享内存不可用时返回 None."""
+        if self._map is None and not self._open():
+            return None
+        return SHM_SEQ.unpack_from(self._map, SHM_SEQ_OFFSET)[0]
+
+    def read(self) -> Optional[List[Dict[str, Any]]]:
+        """返回全部传感器的最新读数，共享内存不可用或尚无数据时返回 None."""
+        snapshot = self.read_snapshot()
+        return snapshot[1] if snapshot is not None else None
+
+    def read_snapshot(self) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """返回 (发布序号, 全部传感器读数)，序号与读数属于同一次发布."""
+        if self._map is None and not self._open():
+            return None
+
+        buf = self._map
+        for _ in range(SHM_MAX_RETRIES):
+            seq1 = SHM_SEQ.unpack_from(buf, SHM_SEQ_OFFSET)[0]
+            if seq1 & 1:
+                continue
+            magic, version, _, count, _ = SHM_HEADER.unpack_from(buf)
+            count = min(count, SHM_MAX_SENSORS)
+            slots = [SHM_SLOT.unpack_from(buf, SHM_HEADER.size + i * SHM_SLOT.size)
+                     for i in range(count)]
+            if SHM_SEQ.unpack_from(buf, SHM_SEQ_OFFSET)[0] != seq1:
+                continue
+            if magic != SHM_MAGIC or version != SHM_VERSION or seq1 == 0:
+                return None
+            return seq1, [self._slot_to_reading(slot) for slot in slots]
+        return None
+
+    @staticmethod
+    def _slot_to_reading(slot) -> Dict[str, Any]:
+        name, timestamp, humidity, temperature, sensor_type, status, _, _ = slot
+        reading = {
+            "name": name.rstrip(b"\0").decode("utf-8", errors="replace"),
+            "type": f"DHT{sensor_type}",
+            "status": SLOT_STATUS.get(status, "no_data"),
+        }
+        if status != 0:
+            reading["timestamp"] = timestamp
+            reading["humidity"] = _from_tenths(humidity)
+            reading["temperature"] = _from_tenths(temperature)
+        return reading
+
+
+_shared_reader = SharedReadingReader()
+
+
+def _read_data_file(data_file: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """从兼容数据文件读取全部传感器，返回 (传感器列表, 错误JSON)."""
+    # 检查文件是否存在
+    if not os.path.exists(data_file):
+        return None, json.dumps({
+            "error": f"温度数据文件不存在: {data_file}。请检查温度监控服务是否正在运行。",
+            "service_status": "stopped"
+        }, ensure_ascii=False)
+
+    # 检查文件是否可读
+    if not os.access(data_file, os.R_OK):
+        return None, json.dumps({
+            "error": f"无法读取温度数据文件: {data_file}",
+            "service_status": "permission_denied"
+        }, ensure_ascii=False)
+
+    # 读取文件内容
+    try:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+
+        if not content:
+            return None, json.dumps({
+                "error": "温度数据文件为空",
+                "service_status": "no_data"
+            }, ensure_ascii=False)
+
+        # 解析JSON数据
+        data = json.loads(content)
+
+        # 多传感器格式
+        if 'sensors' in data:
+            return data['sensors'], None
+
+        # 验证数据结构（单传感器旧格式）
+        required_fields = ['timestamp', 'humidity', 'temperature', 'unit']
+        for field in required_fields:
+            if field not in data:
+                return None, json.dumps({
+                    "error": f"数据文件格式错误，缺少字段: {field}",
+                    "service_status": "invalid_format"
+                }, ensure_ascii=False)
+
+        return [{
+            "name": "default",
+            "type": "DHT11",
+            "status": "ok",
+            "timestamp": data['timestamp'],
+            "humidity": data['humidity'],
+            "temperature": data['temperature'],
+        }], None
+
+    except json.JSONDecodeError as e:
+        return None, json.dumps({
+            "error": f"数据文件JSON格式错误: {str(e)}",
+            "service_status": "json_error"
+        }, ensure_ascii=False)
+    except Exception as e:
+        return None, json.dumps({
+            "error": f"读取数据文件失败: {str(e)}",
+            "service_status": "read_error"
+        }, ensure_ascii=False)
+
+
+def _select_sensor(sensors: List[Dict[str, Any]], selector: Any) -> Optional[Dict[str, Any]]:
+    """按名称或序号选择传感器."""
+    for sensor in sensors:
+        if sensor.get("name") == selector:
+            return sensor
+    try:
+        index = int(selector)
+    except (TypeError, ValueError):
+        return None
+    if 0 <= index < len(sensors):
+        return sensors[index]
+    return None
+
+
+def _single_sensor_response(sensor: Dict[str, Any]) -> str:
+    if "temperature" not in sensor:
+        return json.dumps({
+            "error": f"传感器 {sensor.get('name')} 暂无数据",
+            "name": sensor.get("name"),
+            "service_status": "no_data"
+        }, ensure_ascii=False)
+    data = dict(sensor)
+    data['unit'] = dict(UNIT)
+    data['service_status'] = 'running'
+    return json.dumps(data, ensure_ascii=False, indent=2)
 
 
 async def get_temperature_humidity(args: Dict[str, Any]) -> str:
     """
     获取室内温度和湿度数据.
 
+    优先从共享内存读取最新读数，不可用时回退到数据文件。
+
     Args:
-        args: 参数字典（保留兼容性）
+        args: 参数字典
+            - sensor: 可选，传感器名称（如 "客厅"）或序号；省略时返回全部传感器
 
     Returns:
         JSON字符串，包含温度和湿度数据
     """
     try:
-        # 默认数据文件路径
-        data_file = "/var/lib/temperature_humidity.json"
+        sensors = _shared_reader.read()
+        if sensors is None:
+            sensors, error = _read_data_file(DATA_FILE)
+            if error is not None:
+                return error
 
-        # 检查文件是否存在
-        if not os.path.exists(data_file):
-            return json.dumps({
-                "error": f"温度数据文件不存在: {data_file}。请检查温度监控服务是否正在运行。",
-                "service_status": "stopped"
-            }, ensure_ascii=False)
+        selector = (args or {}).get("sensor")
+        if selector is not None and selector != "":
+            sensor = _select_sensor(sensors, selector)
+            if sensor is None:
+                return json.dumps({
+                    "error": f"未找到传感器: {selector}",
+                    "available": [s.get("name") for s in sensors],
+                    "service_status": "sensor_not_found"
+                }, ensure_ascii=False)
+            return _single_sensor_response(sensor)
 
-        # 检查文件是否可读
-        if not os.access(data_file, os.R_OK):
-            return json.dumps({
-                "error": f"无法读取温度数据文件: {data_file}",
-                "service_status": "permission_denied"
-            }, ensure_ascii=False)
+        # 只有一个传感器时保持旧的平铺格式
+        if len(sensors) == 1:
+            return _single_sensor_response(sensors[0])
+
+        return json.dumps({
+            "sensors": sensors,
+            "unit": dict(UNIT),
+            "service_status": "running"
+        }, ensure_ascii=False, indent=2)
 
-        # 读取文件内容
+    except Exception as e:
+        return json.dumps({
+            "error": f"获取温度湿度数据失败: {str(e)}",
+            "service_status": "unknown_error"
+        }, ensure_ascii=False)
+
+
+# 无法使用 inotify 时退回定时检查发布序号的间隔；共享内存下只是读一个整数，不产生系统调用
+WATCH_POLL_INTERVAL = 0.2
+# 使用 inotify 时也定期检查一次，防止数据文件写入失败而只更新了共享内存时一直等不到
+WATCH_SAFETY_INTERVAL = 5.0
+WATCH_DEFAULT_TIMEOUT = 60
+WATCH_MAX_TIMEOUT = 300
+
+THRESHOLDS = {
+    "temperature_above": ("temperature", operator.gt),
+    "temperature_below": ("temperature", operator.lt),
+    "humidity_above": ("humidity", operator.gt),
+    "humidity_below": ("humidity", operator.lt),
+}
+
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class _PublishWatch:
+    """
+    用 inotify 监视数据文件所在目录，监控服务每次发布都会 rename 一次数据文件（在更新共享内存之后）.
+
+    不是 Linux、目录不存在或事件循环不支持 add_reader 时 fd 为 None，调用方退回定时轮询。
+    """
+
+    def __init__(self, path: str):
+        self.fd = None
+        self.name = os.fsencode(os.path.basename(path))
         try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        directory = os.fsencode(os.path.dirname(os.path.abspath(path)))
+        if libc.inotify_add_watch(fd, directory, IN_MOVED_TO | IN_CLOSE_WRITE) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
 
-            if not content:
-                return json.dumps({
-                    "error": "温度数据文件为空",
-                    "service_status": "no_data"
-                }, ensure_ascii=False)
+    def _drain(self) -> bool:
+        """读出已到的事件，返回其中是否有数据文件被替换或写完"""
+        hit = False
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return hit
+            pos = 0
+            while pos + INOTIFY_EVENT.size <= len(buf):
+                _, _, _, length = INOTIFY_EVENT.unpack_from(buf, pos)
+                pos += INOTIFY_EVENT.size
+                if buf[pos:pos + length].rstrip(b"\0") == self.name:
+                    hit = True
+                pos += length
 
-            # 解析JSON数据
-            data = json.loads(content)
+    async def wait(self, timeout: float) -> None:
+        """等到数据文件被替换或超时"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            ready = loop.create_future()
+            loop.add_reader(self.fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, remaining)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                loop.remove_reader(self.fd)
+            if self._drain():
+                return
 
-            # 验证数据结构
-            required_fields = ['timestamp', 'humidity', 'temperature', 'unit']
-            for field in required_fields:
-                if field not in data:
-                    return json.dumps({
-                        "error": f"数据文件格式错误，缺少字段: {field}",
-                        "service_status": "invalid_format"
-                    }, ensure_ascii=False)
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
 
-            # 添加服务状态
-            data['service_status'] = 'running'
 
-            return json.dumps(data, ensure_ascii=False, indent=2)
+def _current_version() -> Optional[int]:
+    """数据版本：共享内存可用时为发布序号，否则为数据文件的修改时间."""
+    seq = _shared_reader.seq()
+    if seq is not None:
+        return seq
+    try:
+        return os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        return None
 
-        except json.JSONDecodeError as e:
-            return json.dumps({
-                "error": f"数据文件JSON格式错误: {str(e)}",
-                "service_status": "json_error"
-            }, ensure_ascii=False)
-        except Exception as e:
+
+def _read_versioned() -> Tuple[Optional[int], Optional[List[Dict[str, Any]]], Optional[str]]:
+    """返回 (版本, 传感器列表, 错误JSON)."""
+    snapshot = _shared_reader.read_snapshot()
+    if snapshot is not None:
+        return snapshot[0], snapshot[1], None
+    version = _current_version()
+    sensors, error = _read_data_file(DATA_FILE)
+    return version, sensors, error
+
+
+async def watch_readings(since: Optional[int] = None,
+                         poll_interval: float = WATCH_POLL_INTERVAL
+                         ) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    监控服务每发布一次新读数就产出一次 (版本, 全部传感器读数).
+
+    Linux 上用 inotify 等待数据文件被替换，两次发布之间不唤醒（另有 WATCH_SAFETY_INTERVAL 的兜底检查）；
+    inotify 不可用时（如数据文件目录还不存在）退回每 poll_interval 秒检查一次版本，
+    共享内存缺失时每次检查都要 stat 数据文件。
+
+    Args:
+        since: 上次已处理的版本；省略时从当前版本开始，只产出之后的发布
+        poll_interval: 退回轮询时检查版本的间隔（秒）
+    """
+    # 先建监视再取版本，两者之间的发布不会漏掉
+    watch = _PublishWatch(DATA_FILE)
+    try:
+        last = since if since is not None else _current_version()
+        while True:
+            version = _current_version()
+            if version is not None and version != last:
+                version, sensors, _ = _read_versioned()
+                if sensors is not None and version != last:
+                    last = version
+                    yield version, sensors
+            if watch.fd is not None:
+                try:
+                    await watch.wait(WATCH_SAFETY_INTERVAL)
+                    continue
+                except NotImplementedError:
+                    watch.close()
+            await asyncio.sleep(poll_interval)
+    finally:
+        watch.close()
+
+
+def _threshold_state(sensor: Dict[str, Any], thresholds: Dict[str, float]) -> Dict[str, bool]:
+    state = {}
+    for key, limit in thresholds.items():
+        field, compare = THRESHOLDS[key]
+        value = sensor.get(field)
+        state[key] = value is not None and compare(value, limit)
+    return state
+
+
+async def subscribe_temperature_humidity(args: Dict[str, Any]) -> str:
+    """
+    等待温湿度变化（长轮询）.
+
+    不设阈值时，监控服务发布新读数即返回；设置阈值时，只有读数从未满足变为满足
+    某个阈值条件才返回。超时返回当前读数。把返回的 seq 作为下次调用的 since，
+    两次调用之间的发布不会漏掉。
+
+    Args:
+        args: 参数字典
+            - sensor: 可选，只关注某个传感器（名称或序号）
+            - timeout: 可选，最长等待秒数，默认 60，最大 300
+            - since: 可选，上次返回的 seq
+            - temperature_above / temperature_below: 可选，温度阈值
+            - humidity_above / humidity_below: 可选，湿度阈值
+
+    Returns:
+        JSON字符串，event 为 update / threshold / timeout
+    """
+    try:
+        args = args or {}
+        timeout = min(float(args.get("timeout") or WATCH_DEFAULT_TIMEOUT), WATCH_MAX_TIMEOUT)
+        thresholds = {key: float(args[key]) for key in THRESHOLDS if args.get(key) is not None}
+        selector = args.get("sensor")
+        since = args.get("since")
+        since = int(since) if since is not None else None
+
+        version, sensors, error = _read_versioned()
+        if error is not None:
+            return error
+
+        def pick(all_sensors):
+            if selector is None or selector == "":
+                return all_sensors
+            sensor = _select_sensor(all_sensors, selector)
+            return [sensor] if sensor is not None else None
+
+        watched = pick(sensors)
+        if watched is None:
             return json.dumps({
-                "error": f"读取数据文件失败: {str(e)}",
-                "service_status": "read_error"
+                "error": f"未找到传感器: {selector}",
+                "available": [s.get("name") for s in sensors],
+                "service_status": "sensor_not_found"
             }, ensure_ascii=False)
 
+        def response(event, seq, current, triggered=None):
+            data = {"event": event, "seq": seq, "sensors": current, "unit": dict(UNIT)}
+            if triggered:
+                data["triggered"] = triggered
+            data["service_status"] = "running"
+            return json.dumps(data, ensure_ascii=False, indent=2)
+
+        # 调用方带着旧版本号回来，而期间已有新发布：立即返回
+        if not thresholds and since is not None and version != since:
+            return response("update", version, watched)
+
+        states = {s.get("name"): _threshold_state(s, thresholds) for s in watched}
+
+        async def wait():
+            async for seq, all_sensors in watch_readings(since=version):
+                current = pick(all_sensors) or []
+                if not thresholds:
+                    return response("update", seq, current)
+                triggered = []
+                for sensor in current:
+                    name = sensor.get("name")
+                    state = _threshold_state(sensor, thresholds)
+                    before = states.get(name, {})
+                    for key, hit in state.items():
+                        if hit and not before.get(key, False):
+                            field = THRESHOLDS[key][0]
+                            triggered.append({
+                                "sensor": name,
+                                "condition": key,
+                                "threshold": thresholds[key],
+                                "value": sensor.get(field),
+                            })
+                    states[name] = state
+                if triggered:
+                    return response("threshold", seq, current, triggered)
+            return None
+
+        try:
+            return await asyncio.wait_for(wait(), timeout)
+        except asyncio.TimeoutError:
+            version, sensors, error = _read_versioned()
+            if error is not None:
+                return error
+            return response("timeout", version, pick(sensors) or [])
+
     except Exception as e:
         return json.dumps({
-            "error": f"获取温度湿度数据失败: {str(e)}",
+            "error": f"订阅温度湿度数据失败: {str(e)}",
             "service_status": "unknown_error"
-        }, ensure_ascii=False)
\ No newline at end of file
+        }, ensure_ascii=False)